@@ -5,7 +5,8 @@ import interactions
 from interactions.ext import prefixed_commands as prefixed
 from interactions.ext import hybrid_commands as hybrid
 
-from shared import configuration
+from shared import configuration, executor
+from shared.http import HttpClient
 
 if sys.platform == "win32":
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
@@ -19,6 +20,7 @@ class Bot(interactions.Client):
             sync_interactions=True,
             sync_ext=True,
         )
+        self.http_client = HttpClient()
         super().load_extension(
             "interactions.ext.sentry",
             dsn="https://7aadf0c15f880e90e01c4dba496f152d@o233010.ingest.us.sentry.io/4507219660832768",
@@ -40,14 +42,26 @@ class Bot(interactions.Client):
     def init(self) -> None:
         prefixed.setup(self)
         hybrid.setup(self)
+        configuration.init_backend()
         self.start(configuration.get("token"))
 
     async def on_ready(self) -> None:
-        self.redis = await aioredis.create_redis_pool("redis://localhost", minsize=5, maxsize=10)
+        if getattr(self, "redis", None) is None:
+            self.redis = aioredis.from_url("redis://localhost", max_connections=10)
+            await configuration.attach_redis(self.redis)
         print("Logged in as {username} ({id})".format(username=self.user.name, id=self.user.id))
         print("Connected to {0}".format(", ".join([server.name for server in self.guilds])))
         print("--------")
 
+    async def stop(self) -> None:
+        print("HTTP: {0}".format(self.http_client.stats()))
+        await self.http_client.close()
+        executor.shutdown()
+        await configuration.close()
+        if getattr(self, "redis", None) is not None:
+            await self.redis.aclose()
+        await super().stop()
+
 
 def init() -> None:
     client = Bot()
@@ -1,6 +1,5 @@
 import json
 import os
-import aiohttp
 from interactions import Client, CronTrigger, Extension, Task, listen
 
 
@@ -19,10 +18,9 @@ class FnStats(Extension):
     @Task.create(CronTrigger("0 * * * *"))
     async def fetch_stats(self):
         """Fetch and update the statistics."""
-        async with aiohttp.ClientSession() as session:
-            async with session.get("https://api.nitestats.com/v1/epic/modes-smart") as response:
-                data = await response.json()
-                self.data = data
+        async with self.bot.http_client.get("https://api.nitestats.com/v1/epic/modes-smart") as response:
+            data = await response.json()
+            self.data = data
         # self.dump_stats(data)
 
         songs = []
@@ -1,7 +1,9 @@
 from interactions import Client, GuildText, Member, User, Webhook
 from interactions import Extension, listen
 from interactions.api.events import MessageCreate
+from interactions.client.errors import NotFound
 from shared import configuration
+from shared.limited_dict import LRUCache
 
 configuration.DEFAULTS.update(
     {
@@ -35,17 +37,32 @@ def translate_furry(input: str) -> str:
     )
 
 
-async def get_webhook(channel: GuildText) -> Webhook:
+webhooks: LRUCache[int, Webhook] = LRUCache(size_limit=64, ttl=3600)
+
+
+async def find_webhook(channel: GuildText) -> Webhook:
     for wh in await channel.fetch_webhooks():
         return wh
     return await channel.create_webhook(name="Proxy")
 
 
+async def get_webhook(channel: GuildText) -> Webhook:
+    return await webhooks.get_or_load(channel.id, lambda: find_webhook(channel))
+
+
 async def impersonate(user: User | Member, channel: GuildText, content: str) -> None:
     hook = await get_webhook(channel)
-    await hook.send(
-        content, username=user.display_name, avatar_url=str(user.avatar_url)
-    )
+    try:
+        await hook.send(
+            content, username=user.display_name, avatar_url=str(user.avatar_url)
+        )
+    except NotFound:
+        # Someone deleted the cached webhook
+        webhooks.invalidate(channel.id)
+        hook = await get_webhook(channel)
+        await hook.send(
+            content, username=user.display_name, avatar_url=str(user.avatar_url)
+        )
 
 
 def setup(bot: Client) -> None:
@@ -0,0 +1,53 @@
+"""Benchmark: listings per second and allocations for `scraper.parse` on a saved listings page.
+
+The parsed output is checked against pf_bot/fixtures/listings.expected by tests/test_scraper.py; this only times it.
+
+Run with `python -m pf_bot.bench_scraper`.
+"""
+import argparse
+import gc
+import os
+import time
+import tracemalloc
+
+from pf_bot import scraper
+
+PAGE = os.path.join(os.path.dirname(__file__), "fixtures", "listings.html")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=3.0, help="how long to time parsing for")
+    args = parser.parse_args()
+
+    with open(PAGE) as f:
+        html = f.read()
+    listings = scraper.parse(html)
+
+    pages = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < args.seconds:
+        scraper.parse(html)
+        pages += 1
+    elapsed = time.perf_counter() - start
+    print(f"{pages * len(listings) / elapsed:,.0f} listings/s ({elapsed / pages * 1000:.1f}ms per {len(html) / 1024:.0f} KiB page)")
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = scraper.parse(html)
+    _, peak = tracemalloc.get_traced_memory()
+    # The soup is full of reference cycles; collect it so only what the listings keep is counted.
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    blocks = sum(stat.count_diff for stat in stats)
+    size = sum(stat.size_diff for stat in stats)
+    print(f"peak {peak / 1024 / 1024:.1f} MiB while parsing; the {len(result)} listings keep {size / 1024:.0f} KiB in {blocks:,} blocks")
+    for stat in sorted(stats, key=lambda stat: -stat.size_diff)[:5]:
+        print(f"  {stat.traceback[0].filename}: {stat.size_diff / 1024:+.0f} KiB in {stat.count_diff:+,} blocks")
+
+
+if __name__ == "__main__":
+    main()
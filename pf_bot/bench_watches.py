@@ -0,0 +1,88 @@
+"""Benchmark: matching a page of party finder listings against 10,000 watches, with the old nested loop and with WatchIndex.
+Also checks both find the same matches, and reports the memory a parsed page holds and the cost of a role filter per page.
+
+Run with `python -m pf_bot.bench_watches`.
+"""
+import gc
+import os
+import random
+import time
+import tracemalloc
+
+from pf_bot import scraper
+from pf_bot.watches import Watch, WatchIndex, role_mask
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+ROLES = ("", "tank", "healer", "dps")
+
+
+def make_watches(listings: list[scraper.Listing], count: int) -> list[Watch]:
+    rng = random.Random(412)
+    duties = sorted({listing.duty for listing in listings}) + [f"Unlisted duty {n}" for n in range(200)]
+    centres = sorted({listing.data_centre for listing in listings})
+    return [Watch(name=rng.choice(duties), user=rng.randrange(2000), data_centre=rng.choice(centres), role=rng.choice(ROLES), flags="") for _ in range(count)]
+
+
+def nested_loop(listings: list[scraper.Listing], watches: list[Watch]) -> list[tuple[str, Watch]]:
+    """fetch_pf's matching before the index, for every data centre."""
+    matches = []
+    for listing in listings:
+        for watch in watches:
+            if listing.data_centre != watch.data_centre or listing.duty != watch.name:
+                continue
+            if watch.role and not any(slot.role in [watch.role, "empty"] for slot in listing.slots):
+                continue
+            matches.append((listing.id, watch))
+    return matches
+
+
+def indexed(listings: list[scraper.Listing], index: WatchIndex) -> list[tuple[str, Watch]]:
+    return [(listing.id, watch) for listing in listings for watch in index.match(listing)]
+
+
+def timed(func, *args, rounds: int) -> tuple[float, object]:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        result = func(*args)
+    return (time.perf_counter() - start) / rounds, result
+
+
+def role_filters(listings: list[scraper.Listing]) -> tuple[int, int]:
+    """How many (listing, role) pairs pass a role filter, checked over the slots and with the bitmask."""
+    by_slots = sum(1 for listing in listings for role in ROLES[1:] if any(slot.role in [role, "empty"] for slot in listing.slots))
+    by_mask = sum(1 for listing in listings for role in ROLES[1:] if listing.roles & role_mask(role))
+    return by_slots, by_mask
+
+
+def main() -> None:
+    with open(os.path.join(FIXTURES, "listings.html")) as f:
+        html = f.read()
+    gc.collect()
+    tracemalloc.start()
+    listings = scraper.parse(html)
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"{len(listings)} listings hold {retained / 1024:.0f} KiB ({retained / len(listings):.0f} bytes each)")
+
+    masks = [role_mask(role) for role in ROLES[1:]]
+    slots, _ = timed(lambda: [any(slot.role in [role, "empty"] for slot in listing.slots) for listing in listings for role in ROLES[1:]], rounds=50)
+    bits, _ = timed(lambda: [listing.roles & mask for listing in listings for mask in masks], rounds=50)
+    by_slots, by_mask = role_filters(listings)
+    print(f"role filter per page: slots {slots * 1000:.2f}ms, bitmask {bits * 1000:.2f}ms, same result: {by_slots == by_mask}")
+    for count in (100, 1000, 10000):
+        watches = make_watches(listings, count)
+        start = time.perf_counter()
+        index = WatchIndex(watches)
+        build = time.perf_counter() - start
+        old, expected = timed(nested_loop, listings, watches, rounds=3)
+        new, result = timed(indexed, listings, index, rounds=20)
+        same = sorted(set(expected)) == sorted(result)
+        print(
+            f"{count:>6} watches x {len(listings)} listings: nested {old * 1000:8.1f}ms, indexed {new * 1000:6.2f}ms"
+            f" (+{build * 1000:.1f}ms to build), {len(result)} matches, same matches: {same}"
+        )
+
+
+if __name__ == "__main__":
+    main()
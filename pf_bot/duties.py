@@ -0,0 +1,76 @@
+import bisect
+from collections import Counter
+from typing import Iterable
+
+
+class DutyIndex:
+    """Duty names for autocomplete, kept sorted by their case-folded form.
+
+    Prefix matches come from a bisect into the sorted keys. Names that merely contain the input, then names that contain
+    its letters in order, follow. Each group is ranked by how many listings had that duty in the latest scrape.
+    """
+
+    def __init__(self, names: Iterable[str] = ()) -> None:
+        self.keys: list[tuple[str, str]] = sorted({(name.casefold(), name) for name in names})
+        self.names = {name for _, name in self.keys}
+        self.popularity: Counter[str] = Counter()
+        self.dirty = False
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.names
+
+    def add(self, name: str) -> bool:
+        if not name or name in self.names:
+            return False
+        bisect.insort(self.keys, (name.casefold(), name))
+        self.names.add(name)
+        self.dirty = True
+        return True
+
+    def observe(self, duties: Iterable[str]) -> None:
+        """Record the duties listed in a scrape, adding any new ones."""
+        self.popularity = Counter(duty for duty in duties if duty)
+        for duty in self.popularity:
+            self.add(duty)
+
+    def search(self, text: str, limit: int = 24) -> list[str]:
+        def rank(name: str) -> tuple[int, str]:
+            return (-self.popularity[name], name.casefold())
+
+        query = text.casefold().strip()
+        if not query:
+            return sorted(self.names, key=rank)[:limit]
+
+        start = bisect.bisect_left(self.keys, (query,))
+        prefix = []
+        for i in range(start, len(self.keys)):
+            key, name = self.keys[i]
+            if not key.startswith(query):
+                break
+            prefix.append(name)
+        results = sorted(prefix, key=rank)
+        if len(results) >= limit:
+            return results[:limit]
+
+        found = set(prefix)
+        contains = [name for key, name in self.keys if query in key and name not in found]
+        results += sorted(contains, key=rank)
+        if len(results) >= limit:
+            return results[:limit]
+
+        found.update(contains)
+        fuzzy = [name for key, name in self.keys if name not in found and is_subsequence(query, key)]
+        results += sorted(fuzzy, key=rank)
+        return results[:limit]
+
+    def to_json(self) -> list[str]:
+        return [name for _, name in self.keys]
+
+
+def is_subsequence(query: str, text: str) -> bool:
+    """Whether the characters of `query` appear in `text` in order, like "tea" in "The Epic of Alexander"."""
+    chars = iter(text)
+    return all(char in chars for char in query if char != " ")
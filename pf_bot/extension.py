@@ -1,23 +1,34 @@
+import asyncio
 import json
 import os
-from typing import NamedTuple
+import aiohttp
 from interactions import AutocompleteContext, Extension, IntervalTrigger, OptionType, Task, listen, slash_command, slash_option, SlashCommandChoice
+import sentry_sdk
+from shared import configuration
+from shared.limited_dict import LRUCache
 from . import scraper
+from .duties import DutyIndex
+from .journal import WatchJournal
+from .tracker import ListingTracker
+from .watches import Watch, WatchIndex
 
-
-class Watch(NamedTuple):
-    name: str
-    user: int
-    data_centre: str
-    role: str
-    flags: str
+configuration.DEFAULTS.update(
+    {
+        # Seconds allowed for downloading and parsing the listings.
+        "pf_scrape_timeout": 30,
+    }
+)
 
 
 class PartyFinderWatcher(Extension):
     def __init__(self, bot):
-        self.dirty = False
-        self.watches: list[Watch] = []
-        self.autocomplete: set[str] = set()
+        self.journal = WatchJournal()
+        self.watches = WatchIndex(self.journal.replay())
+        # Watches added since the last scrape; they're checked against every listing, not just new and changed ones.
+        self.fresh: set[Watch] = set()
+        self.tracker = ListingTracker()
+        self.duties = DutyIndex()
+        self.users = LRUCache(size_limit=512, ttl=3600)
         self.load()
 
     @listen()
@@ -27,17 +38,20 @@ class PartyFinderWatcher(Extension):
 
     @listen()
     async def on_shutdown(self):
-        self.save()
+        if self.duties.dirty:
+            self.save()
+        self.journal.close()
 
     def load(self):
         if os.path.exists("duty_names.json"):
             with open("duty_names.json", "r") as f:
-                self.autocomplete = set(json.load(f))
+                self.duties = DutyIndex(json.load(f))
 
     def save(self):
-        dump = json.dumps(list(self.autocomplete), indent=2)
+        dump = json.dumps(self.duties.to_json(), indent=2)
         with open("duty_names.json", "w") as f:
             f.write(dump)
+        self.duties.dirty = False
 
     @slash_command()
     @slash_option("duty", "The duty to watch for", opt_type=OptionType.STRING, required=True)
@@ -53,40 +67,54 @@ class PartyFinderWatcher(Extension):
         if role == "any":
             role = ""
         flags = ""
-        self.watches.append(Watch(name=duty, user=ctx.author.id, data_centre=dc, role=role, flags=flags))
+        watch = Watch(name=duty, user=ctx.author.id, data_centre=dc, role=role, flags=flags)
+        self.watches.add(watch)
+        self.journal.add(watch)
+        self.fresh.add(watch)
         await ctx.send(f"Watching for {duty}!", ephemeral=True)
 
     @watch_pf.autocomplete("duty")
     async def duty_autocomplete(self, ctx: AutocompleteContext):
-        options = list(self.autocomplete)
-        options.sort()
-        if ctx.input_text:
-            options = [duty for duty in options if duty.lower().startswith(ctx.input_text.lower())]
-        await ctx.send(options[:24])
+        await ctx.send(self.duties.search(ctx.input_text or ""))
 
     @Task.create(IntervalTrigger(seconds=60))
     async def fetch_pf(self):
-        if not self.watches and self.autocomplete:
+        if not self.watches and self.duties:
+            return
+        try:
+            listings = await scraper.scrape_async(self.bot.http_client, configuration.get("pf_scrape_timeout"))
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"PF: scrape failed: {e!r}")
+            sentry_sdk.capture_exception(e)
             return
-        listings = scraper.scrape()
+        changed = self.tracker.update(listings)
+        self.duties.observe(listing.duty for listing in listings)
+        fresh, self.fresh = self.fresh, set()
         for listing in listings:
-            if listing.duty not in self.autocomplete:
-                self.autocomplete.add(listing.duty)
-                self.dirty = True
-
-            if listing.data_centre != "Materia":
+            if listing.id in changed:
+                watches = self.watches.match(listing)
+            elif fresh:
+                watches = [watch for watch in self.watches.match(listing) if watch in fresh]
+            else:
                 continue
-            for watch in self.watches.copy():
-                if listing.duty == watch.name:
-                    user = await self.bot.fetch_user(watch.user)
+
+            for watch in watches:
+                try:
+                    user = await self.users.get_or_load(watch.user, lambda: self.bot.fetch_user(watch.user))
                     if user is None:
                         continue
-                    if watch.role and not any(slot.role in [watch.role, "empty"] for slot in listing.slots):
-                        continue
 
                     await user.send(f"New party finder listing for {listing.duty}\n{repr(listing)}")
-                    self.watches.remove(watch)
+                except Exception as e:
+                    # This listing won't count as changed next time, so check the watch against every listing again.
+                    self.fresh.add(watch)
+                    print(e)
+                    sentry_sdk.capture_exception(e)
+                    continue
+                self.watches.remove(watch)
+                self.journal.remove(watch)
 
-        if self.dirty:
+        self.journal.maybe_compact(self.watches)
+        print("PF: listings {added} added, {changed} changed, {removed} removed, {unchanged} unchanged".format(**self.tracker.last))
+        if self.duties.dirty:
             self.save()
-            self.dirty = False
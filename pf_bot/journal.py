@@ -0,0 +1,90 @@
+import json
+import os
+import tempfile
+from typing import Iterable
+
+from .watches import Watch, WatchIndex
+
+
+class WatchJournal:
+    """Append-only log of watches added and removed, so they survive restarts.
+
+    Each change is one JSON line appended to `path`. `replay()` rebuilds the watches at startup, and `maybe_compact()`
+    rewrites the file as just the live watches once removed ones make up most of it.
+    A line cut short by a crash is skipped on replay.
+    """
+
+    def __init__(self, path: str = "pf_watches.journal", min_compact: int = 1000, ratio: int = 2) -> None:
+        self.path = path
+        self.min_compact = min_compact
+        self.ratio = ratio
+        self.lines = 0
+        self.file = None
+        # Set when the last line was cut short, so the next append starts on a fresh line.
+        self.torn = False
+
+    def replay(self) -> list[Watch]:
+        watches: dict[Watch, None] = {}
+        self.lines = 0
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                for line in f:
+                    self.torn = not line.endswith("\n")
+                    try:
+                        op, fields = json.loads(line)
+                        watch = Watch(*fields)
+                    except (ValueError, TypeError):
+                        continue
+                    self.lines += 1
+                    if op == "add":
+                        watches[watch] = None
+                    else:
+                        watches.pop(watch, None)
+        return list(watches)
+
+    def add(self, watch: Watch) -> None:
+        self._append("add", watch)
+
+    def remove(self, watch: Watch) -> None:
+        self._append("remove", watch)
+
+    def _append(self, op: str, watch: Watch) -> None:
+        if self.file is None:
+            self.file = open(self.path, "a")
+            if self.torn:
+                self.file.write("\n")
+                self.torn = False
+        self.file.write(json.dumps([op, watch]) + "\n")
+        self.file.flush()
+        self.lines += 1
+
+    def maybe_compact(self, watches: WatchIndex) -> bool:
+        if self.lines <= max(self.min_compact, len(watches) * self.ratio):
+            return False
+        self.compact(watches)
+        return True
+
+    def compact(self, watches: Iterable[Watch]) -> None:
+        """Replace the journal with one add per live watch."""
+        self.close()
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(prefix=".pf_watches.", suffix=".tmp", dir=directory)
+        lines = 0
+        try:
+            with os.fdopen(fd, "w") as f:
+                for watch in watches:
+                    f.write(json.dumps(["add", watch]) + "\n")
+                    lines += 1
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self.lines = lines
+        self.torn = False
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
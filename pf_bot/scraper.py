@@ -1,13 +1,39 @@
+import asyncio
+import sys
+
 import attrs
 import bs4
 import requests
 
+from shared.executor import run_parser
+from shared.http import HttpClient
+
+LISTINGS_URL = "https://xivpf.com/listings"
+
+ROLES = ("empty", "tank", "healer", "dps")
+ROLE_IDS = {role: i for i, role in enumerate(ROLES)}
+# One bit per role, for Listing.roles.
+ROLE_BITS = {role: 1 << i for i, role in enumerate(ROLES)}
+
+
+def intern(value: str | None) -> str | None:
+    """The same few data centres, duties and jobs repeat across every listing, so keep one copy of each."""
+    return None if value is None else sys.intern(value)
+
 
 @attrs.define()
 class PartySlot:
     filled: bool
-    role: str
-    job: str = attrs.field(repr=False)
+    role_id: int
+    job: str = attrs.field(repr=False, converter=intern)
+
+    @property
+    def role(self) -> str:
+        return ROLES[self.role_id]
+
+    def __reduce__(self):
+        # Through __init__, so strings are interned again after coming back from a parse process.
+        return PartySlot, (self.filled, self.role_id, self.job)
 
     def __repr__(self) -> str:
         if self.filled:
@@ -25,9 +51,9 @@ class PartySlot:
 @attrs.define()
 class Listing:
     id: str
-    data_centre: str
-    category: str
-    duty: str
+    data_centre: str = attrs.field(converter=intern)
+    category: str = attrs.field(converter=intern)
+    duty: str = attrs.field(converter=intern)
     description: str
     slots: list[PartySlot]
     updated: str
@@ -37,52 +63,67 @@ class Listing:
     duty_complete: bool
     duty_completion: bool
     practice: bool
+    # ROLE_BITS of every slot's role, so a role filter is a single AND.
+    roles: int = attrs.field(default=0, repr=False)
+
+    def __reduce__(self):
+        return Listing, attrs.astuple(self, recurse=False)
 
 
 def scrape() -> list[Listing]:
-    listings = []
-    req = requests.get("https://xivpf.com/listings")
+    """Blocking version, for running this module from the command line."""
+    req = requests.get(LISTINGS_URL)
     req.raise_for_status()
-    soup = bs4.BeautifulSoup(req.text, "html.parser")
+    return parse(req.text)
+
+
+async def scrape_async(http: HttpClient, timeout: float = 30) -> list[Listing]:
+    """Download and parse the listings without blocking the event loop. Raises asyncio.TimeoutError if that takes over `timeout` seconds."""
+    return await asyncio.wait_for(_scrape(http), timeout)
+
+
+async def _scrape(http: HttpClient) -> list[Listing]:
+    async with http.get(LISTINGS_URL) as resp:
+        resp.raise_for_status()
+        html = await resp.text()
+    return await run_parser(parse, html)
+
+
+def parse(html: str) -> list[Listing]:
+    listings = []
+    soup = bs4.BeautifulSoup(html, "html.parser")
     for listing in soup.find_all("div", class_="listing"):
         duty = listing.find("div", class_="duty")
         description = listing.find("div", class_="description")
         slots = listing.find_all("div", class_="slot")
         party = []
+        roles = 0
         for slot in slots:
             role = "tank" if "tank" in slot["class"] else "healer" if "healer" in slot["class"] else "dps" if "dps" in slot["class"] else "empty"
+            roles |= ROLE_BITS[role]
             party.append(
                 PartySlot(
                     filled="filled" in slot["class"],
-                    role=role,
+                    role_id=ROLE_IDS[role],
                     job=slot["title"],
                 )
             )
         updated = listing.find("div", class_="updated")
         expires = listing.find("div", class_="expires")
-        loot = False
-        duty_complete = False
-        duty_completion = False
-        practice = False
-        if "[Loot]" in description.text:
-            loot = True
-            # description.text.replace('[Loot]', '')
-        if "[Duty Complete]" in description.text:
-            # description.text.replace('[Duty Complete]', '')
-            duty_complete = True
-        if "[Duty Completion]" in description.text:
-            # description.text.replace('[Duty Completion]', '')
-            duty_completion = True
-        if "[Practice]" in description.text:
-            # description.text.replace('[Practice]', '')
-            practice = True
+        # .text walks the element's children each time it's read, so only read it once.
+        text = description.text if description else None
+        flags = text or ""
+        loot = "[Loot]" in flags
+        duty_complete = "[Duty Complete]" in flags
+        duty_completion = "[Duty Completion]" in flags
+        practice = "[Practice]" in flags
 
         pf = Listing(
             id=listing["data-id"],
             data_centre=listing["data-centre"],
             category=listing["data-pf-category"],
             duty=duty.text if duty else None,
-            description=description.text if description else None,
+            description=text,
             slots=party,
             updated=updated.text.strip() if updated else None,
             expires=expires.text.strip() if expires else None,
@@ -90,6 +131,7 @@ def scrape() -> list[Listing]:
             duty_complete=duty_complete,
             duty_completion=duty_completion,
             practice=practice,
+            roles=roles,
         )
 
         listings.append(pf)
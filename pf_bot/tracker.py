@@ -0,0 +1,36 @@
+from .scraper import Listing
+
+
+def fingerprint(listing: Listing) -> int:
+    """Hash of what a watcher cares about. The relative `updated` and `expires` times change every scrape, so they're left out."""
+    slots = tuple((slot.filled, slot.role_id, slot.job) for slot in listing.slots)
+    return hash((listing.data_centre, listing.category, listing.duty, listing.description, slots))
+
+
+class ListingTracker:
+    """Remembers the last scrape by listing id, so only new and changed listings need looking at."""
+
+    def __init__(self) -> None:
+        self.fingerprints: dict[str, int] = {}
+        self.last = {"added": 0, "changed": 0, "removed": 0, "unchanged": 0}
+
+    def update(self, listings: list[Listing]) -> set[str]:
+        """Record a scrape. Returns the ids of listings that are new or changed since the previous one."""
+        previous = self.fingerprints
+        current = {}
+        fresh = set()
+        added = changed = 0
+        for listing in listings:
+            value = current[listing.id] = fingerprint(listing)
+            old = previous.get(listing.id)
+            if old == value:
+                continue
+            fresh.add(listing.id)
+            if old is None:
+                added += 1
+            else:
+                changed += 1
+        removed = sum(1 for listing_id in previous if listing_id not in current)
+        self.fingerprints = current
+        self.last = {"added": added, "changed": changed, "removed": removed, "unchanged": len(current) - added - changed}
+        return fresh
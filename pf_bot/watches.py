@@ -0,0 +1,67 @@
+from typing import Iterator, NamedTuple
+
+from .scraper import ROLE_BITS, Listing
+
+
+class Watch(NamedTuple):
+    name: str
+    user: int
+    data_centre: str
+    role: str
+    flags: str
+
+
+class WatchIndex:
+    """Watches grouped by (data centre, duty), then by the role they want.
+
+    Matching a listing is a dictionary lookup plus a check per distinct role, however many watches there are.
+    Identical watches are kept once.
+    """
+
+    def __init__(self, watches: list[Watch] = ()) -> None:
+        self.index: dict[tuple[str, str], dict[str, dict[Watch, None]]] = {}
+        self.count = 0
+        for watch in watches:
+            self.add(watch)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self) -> Iterator[Watch]:
+        for roles in self.index.values():
+            for watches in roles.values():
+                yield from watches
+
+    def add(self, watch: Watch) -> None:
+        watches = self.index.setdefault((watch.data_centre, watch.name), {}).setdefault(watch.role, {})
+        if watch not in watches:
+            watches[watch] = None
+            self.count += 1
+
+    def remove(self, watch: Watch) -> None:
+        key = (watch.data_centre, watch.name)
+        roles = self.index.get(key)
+        if not roles or watch not in roles.get(watch.role, ()):
+            return
+        del roles[watch.role][watch]
+        self.count -= 1
+        if not roles[watch.role]:
+            del roles[watch.role]
+            if not roles:
+                del self.index[key]
+
+    def match(self, listing: Listing) -> list[Watch]:
+        """Watches that this listing satisfies: same data centre and duty, and a slot open for the role, if they asked for one."""
+        roles = self.index.get((listing.data_centre, listing.duty))
+        if not roles:
+            return []
+        matches = []
+        for role, watches in roles.items():
+            if not role or listing.roles & role_mask(role):
+                matches.extend(watches)
+        return matches
+
+
+def role_mask(role: str) -> int:
+    """Listing.roles bits that satisfy a watch for `role`: a slot for that role, or one open to anyone."""
+    return ROLE_BITS.get(role, 0) | ROLE_BITS["empty"]
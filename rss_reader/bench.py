@@ -0,0 +1,229 @@
+"""Load test for the whole RSS pipeline, without the network or Discord.
+
+A local aiohttp server plays every site: feeds in WordPress, comic-rocket (Freefall, through the iframe), cc-comic and
+div-comic styles, and their item pages from rss_reader/fixtures. Outbound requests are rewritten to it, keeping the
+original host in the path, so per-host limits behave as they would live. `bot.fetch_user` and `user.send` are stubs.
+
+Each run polls N subscriptions twice: once with everything new, then again with nothing new, which should mostly be 304s.
+Reports feeds/s, requests per feed, time spent parsing, messages sent, and peak memory (from a separate run under tracemalloc).
+
+Run with `python -m rss_reader.bench [--feeds 200] [--items 8] [--subscribers 1]`.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import tracemalloc
+import urllib.parse
+from collections import Counter
+from email.utils import formatdate
+from types import SimpleNamespace
+
+from aiohttp import web
+
+from rss_reader.seen import SeenSet
+from shared import configuration, executor
+from shared.http import HttpClient
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+STYLES = ("wordpress", "comic-rocket", "cc-comic", "div-comic")
+HOSTS = 20
+
+
+def fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES, name)) as f:
+        return f.read()
+
+
+class FixtureServer:
+    """Serves /<host>/<path> for every fake host, and counts requests."""
+
+    def __init__(self, items: int) -> None:
+        self.items = items
+        self.hits: Counter[str] = Counter()
+        self.pages = {
+            "wordpress": fixture("wordpress.html"),
+            "comic-rocket": fixture("comic_rocket.html"),
+            "freefall": fixture("freefall.html"),
+            "cc-comic": fixture("cc_comic.html"),
+            "div-comic": fixture("div_comic.html"),
+        }
+        self.runner: web.AppRunner | None = None
+        self.base = ""
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_get("/{host}/{path:.*}", self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base = f"http://127.0.0.1:{port}"
+        return self.base
+
+    async def stop(self) -> None:
+        await self.runner.cleanup()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        host = request.match_info["host"]
+        path = request.match_info["path"]
+        self.hits[host] += 1
+        if path.startswith("feeds/"):
+            etag = f'"{path}"'
+            if request.headers.get("If-None-Match") == etag:
+                return web.Response(status=304)
+            style, n = path.split("/")[1:3]
+            return web.Response(text=feed_xml(style, host, int(n), self.items), content_type="application/rss+xml", headers={"ETag": etag})
+        if host == "www.comic-rocket.com":
+            return web.Response(text=self.pages["comic-rocket"], content_type="text/html")
+        if host == "freefall.purrsia.com":
+            return web.Response(text=self.pages["freefall"], content_type="text/html")
+        style = path.split("/")[0]
+        if style in self.pages:
+            return web.Response(text=self.pages[style], content_type="text/html")
+        return web.Response(status=404)
+
+
+def feed_xml(style: str, host: str, n: int, items: int) -> str:
+    channel_link = f"https://{host}/"
+    generator = ""
+    if style == "wordpress":
+        generator = "<generator>https://wordpress.org/?v=6.4.2</generator>"
+    elif style == "comic-rocket":
+        channel_link = "https://www.comic-rocket.com/feeds/freefall"
+    entries = []
+    for i in range(items):
+        if style == "comic-rocket":
+            link = f"https://www.comic-rocket.com/read/freefall/{n}-{i}"
+        else:
+            link = f"https://{host}/{style}/{n}/{i}"
+        published = formatdate(1700000000 + i * 86400, usegmt=True)
+        entries.append(f"<item><title>Page {i}</title><link>{link}</link><guid>{link}</guid><pubDate>{published}</pubDate></item>")
+    return (
+        '<?xml version="1.0"?><rss version="2.0"><channel>'
+        f"<title>{style} {n}</title><link>{channel_link}</link><description>Benchmark feed</description>{generator}{''.join(entries)}"
+        "</channel></rss>"
+    )
+
+
+class LocalHttpClient(HttpClient):
+    """HttpClient that sends every request to the fixture server instead."""
+
+    def __init__(self, base: str) -> None:
+        super().__init__()
+        self.base = base
+
+    def get(self, url: str, **kwargs):
+        parts = urllib.parse.urlsplit(url)
+        local = f"{self.base}/{parts.netloc}{parts.path}"
+        if parts.query:
+            local += "?" + parts.query
+        return super().get(local, **kwargs)
+
+
+class StubUser:
+    def __init__(self, user_id: int) -> None:
+        self.id = user_id
+        self.messages = 0
+        self.embeds = 0
+
+    async def send(self, content=None, embeds=None, **kwargs) -> None:
+        self.messages += 1
+        self.embeds += len(embeds or [])
+
+
+def make_feeds(count: int, subscribers: int) -> list[dict]:
+    feeds = []
+    for n in range(count // subscribers or 1):
+        style = STYLES[n % len(STYLES)]
+        url = f"https://site{n % HOSTS}.test/feeds/{style}/{n}"
+        for s in range(subscribers):
+            feeds.append({"url": url, "seen": SeenSet(), "user": 1000 + (n * subscribers + s) % 50, "next_check": 0})
+    return feeds
+
+
+async def run(count: int, items: int, subscribers: int) -> dict:
+    from rss_reader.rss_extension import RssReader
+
+    server = FixtureServer(items)
+    base = await server.start()
+    users: dict[int, StubUser] = {}
+
+    async def fetch_user(user_id: int) -> StubUser:
+        return users.setdefault(user_id, StubUser(user_id))
+
+    bot = SimpleNamespace(http_client=LocalHttpClient(base), fetch_user=fetch_user, ext={})
+    # Extension.__new__ wants a real client; the reader itself only needs the attributes above.
+    reader = object.__new__(RssReader)
+    reader.bot = bot
+    reader.__init__(bot)
+    reader.feeds[:] = make_feeds(count, subscribers)
+    results = {"feeds": len(reader.feeds)}
+    try:
+        for name in ("first", "repeat"):
+            for feed in reader.feeds:
+                feed["next_check"] = 0
+            server.hits.clear()
+            executor.reset_parse_stats()
+            sent = sum(user.messages for user in users.values())
+            start = time.perf_counter()
+            await reader.poll_due_feeds()
+            while reader.outbox.workers:
+                await asyncio.sleep(0.01)
+            elapsed = time.perf_counter() - start
+            results[name] = {
+                "seconds": elapsed,
+                "requests": sum(server.hits.values()),
+                "parse": executor.parse_stats(),
+                "messages": sum(user.messages for user in users.values()) - sent,
+            }
+    finally:
+        await bot.http_client.close()
+        await server.stop()
+        reader.store.close()
+    return results
+
+
+def report(results: dict) -> None:
+    feeds = results["feeds"]
+    print(f"{'poll':<8} {'feeds/s':>9} {'req/feed':>9} {'parse (ms)':>11} {'messages':>9}")
+    for name in ("first", "repeat"):
+        run = results[name]
+        parse_ms = sum(stat["seconds"] for stat in run["parse"].values()) * 1000
+        print(f"{name:<8} {feeds / run['seconds']:>9.1f} {run['requests'] / feeds:>9.2f} {parse_ms:>11.0f} {run['messages']:>9}")
+    for name, stat in sorted(results["first"]["parse"].items(), key=lambda kv: -kv[1]["seconds"]):
+        print(f"  {name:<20} {stat['calls']:>6} calls {stat['seconds'] * 1000:>9.1f}ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--feeds", type=int, default=200, help="number of subscriptions")
+    parser.add_argument("--items", type=int, default=8, help="entries per feed")
+    parser.add_argument("--subscribers", type=int, default=1, help="subscriptions per feed URL")
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        # The reader keeps feeds.db and config.json in the working directory; don't touch the real ones.
+        os.chdir(tmp)
+        try:
+            configuration.write("rss_batch_window", 0.2)
+            configuration.write("rss_max_items", 1_000_000)
+            print(f"parse executor: {configuration.get('parse_executor')}")
+            report(asyncio.run(run(args.feeds, args.items, args.subscribers)))
+
+            os.remove("feeds.db")
+            tracemalloc.start()
+            asyncio.run(run(args.feeds, args.items, args.subscribers))
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"peak memory (tracemalloc, this process only): {peak / 1024 / 1024:.1f} MiB")
+        finally:
+            executor.shutdown()
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
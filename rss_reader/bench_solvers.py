@@ -0,0 +1,48 @@
+"""Benchmark: pages per second for each solver's extraction, parsing the whole page with html.parser versus only the
+elements the solver needs (with lxml when it's installed). Also checks both produce the same result.
+
+Run with `python -m rss_reader.bench_solvers`.
+"""
+import os
+import time
+
+from rss_reader import solvers
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+PAGE_URL = "https://example.com/comic/page-412"
+
+CASES = [
+    ("WordpressSolver", "wordpress.html", solvers.extract_wordpress, ()),
+    ("FreefallSolver", "freefall.html", solvers.extract_first_img, ()),
+    ("comic-rocket iframe", "comic_rocket.html", solvers.find_iframe, ()),
+    ("ImgIdSolver", "cc_comic.html", solvers.extract_img_id, ("cc-comic", PAGE_URL)),
+    ("DivIdSolver", "div_comic.html", solvers.extract_div_img, ("comic",)),
+    ("UnknownSolver probe", "cc_comic.html", solvers.probe, (PAGE_URL,)),
+]
+
+
+def pages_per_second(func, html: str, args: tuple, seconds: float = 1.0) -> tuple[float, object]:
+    result = func(html, *args)
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        func(html, *args)
+        count += 1
+    return count / (time.perf_counter() - start), result
+
+
+def main() -> None:
+    print(f"parser: {solvers.HTML_FEATURES}")
+    print(f"{'solver':<22} {'fixture':<18} {'full (pages/s)':>15} {'targeted (pages/s)':>19} {'speedup':>8}  same output")
+    for name, fixture, func, args in CASES:
+        with open(os.path.join(FIXTURES, fixture)) as f:
+            html = f.read()
+        solvers.USE_TARGETS = False
+        full, expected = pages_per_second(func, html, args)
+        solvers.USE_TARGETS = True
+        targeted, result = pages_per_second(func, html, args)
+        print(f"{name:<22} {fixture:<18} {full:>15.0f} {targeted:>19.0f} {targeted / full:>7.1f}x  {result == expected}")
+
+
+if __name__ == "__main__":
+    main()
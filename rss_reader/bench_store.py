@@ -0,0 +1,55 @@
+"""Benchmark: cost of saving one changed feed as the number of feeds grows, against rewriting feeds.json.
+
+Run with `python -m rss_reader.bench_store`.
+"""
+import json
+import os
+import tempfile
+import time
+
+from rss_reader.seen import to_json
+from rss_reader.store import open_store
+
+
+def make_feed(i: int) -> dict:
+    return {
+        "url": f"https://example{i % 50}.com/feed/{i}",
+        "user": 1000 + i % 20,
+        "title": f"Feed {i}",
+        "solver": "ImgIdSolver",
+        "img_id": "cc-comic",
+        "latest": {"guid": f"https://example.com/{i}/40", "title": "Page 40", "published": "Mon, 01 Jan 2024 00:00:00 GMT"},
+        "seen": [f"https://example.com/{i}/{n}" for n in range(40)],
+    }
+
+
+def main() -> None:
+    print(f"{'feeds':>8} {'sqlite save (ms)':>18} {'json save (ms)':>16}")
+    for count in (100, 1000, 5000, 20000):
+        with tempfile.TemporaryDirectory() as tmp:
+            legacy = os.path.join(tmp, "feeds.json")
+            with open(legacy, "w") as f:
+                json.dump([make_feed(i) for i in range(count)], f)
+            store, feeds = open_store(os.path.join(tmp, "feeds.db"), legacy)
+            rounds = 200
+            start = time.perf_counter()
+            for n in range(rounds):
+                feed = feeds[n % count]
+                feed["seen"].add(f"new-{n}")
+                feed["seen"].evict_oldest()
+                feed["latest"]["title"] = f"Page {n}"
+                store.save(feed)
+            sqlite_ms = (time.perf_counter() - start) / rounds * 1000
+
+            json_rounds = 5
+            start = time.perf_counter()
+            for _ in range(json_rounds):
+                with open(legacy, "w") as f:
+                    f.write(json.dumps(feeds, indent=2, default=to_json))
+            json_ms = (time.perf_counter() - start) / json_rounds * 1000
+            store.close()
+        print(f"{count:>8} {sqlite_ms:>18.3f} {json_ms:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import time
+import urllib.parse
+
+DAY = 24 * 60 * 60
+
+
+def page_key(url: str) -> tuple[str, str]:
+    """(host, pattern) for a page URL. The pattern is the first path segment, unless it looks like part of a date or an id."""
+    parts = urllib.parse.urlsplit(url)
+    segments = [segment for segment in parts.path.split("/") if segment]
+    pattern = ""
+    if len(segments) > 1 and not segments[0].isdigit():
+        pattern = segments[0]
+    return parts.netloc.lower(), pattern
+
+
+class HostClassifier:
+    """Remembers which solver works for pages on a host, so new feeds there don't have to probe.
+
+    Each entry counts how many times the classification has been confirmed, and is only trusted from `min_confidence` on.
+    Entries expire `ttl` seconds after they were last confirmed, and a miss on any page drops every entry for that host.
+    """
+
+    def __init__(self, entries: list[dict] | None = None, ttl: float = 30 * DAY, min_confidence: int = 2, clock=time.time) -> None:
+        self.ttl = ttl
+        self.min_confidence = min_confidence
+        self.clock = clock
+        self.entries: dict[tuple[str, str], dict] = {}
+        for entry in entries or []:
+            self.entries[(entry["host"], entry["pattern"])] = entry
+        self.changed: set[tuple[str, str]] = set()
+        self.removed: set[tuple[str, str]] = set()
+
+    def lookup(self, url: str) -> dict | None:
+        """Solver settings for a page, like {"solver": "ImgIdSolver", "img_id": "cc-comic"}, if known."""
+        key = page_key(url)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry["expires"] <= self.clock():
+            del self.entries[key]
+            self.changed.discard(key)
+            self.removed.add(key)
+            return None
+        if entry["confidence"] < self.min_confidence:
+            return None
+        return {"solver": entry["solver"], entry["key"]: entry["value"]}
+
+    def confirm(self, url: str, solver: str, key: str, value: str) -> None:
+        host, pattern = page_key(url)
+        entry = self.entries.get((host, pattern))
+        if entry and (entry["solver"], entry["key"], entry["value"]) == (solver, key, value):
+            entry["confidence"] += 1
+        else:
+            entry = {"host": host, "pattern": pattern, "solver": solver, "key": key, "value": value, "confidence": 1}
+            self.entries[(host, pattern)] = entry
+        entry["expires"] = self.clock() + self.ttl
+        self.changed.add((host, pattern))
+
+    def invalidate(self, url: str) -> int:
+        """Forget everything about the page's host. Returns how many entries were dropped."""
+        host = page_key(url)[0]
+        keys = [key for key in self.entries if key[0] == host]
+        for key in keys:
+            del self.entries[key]
+            self.changed.discard(key)
+            self.removed.add(key)
+        return len(keys)
+
+    def drain_changes(self) -> tuple[list[dict], list[tuple[str, str]]]:
+        """Return (entries to upsert, (host, pattern) keys to delete) since the last call. Deletes should be applied first."""
+        changed = [dict(self.entries[key]) for key in self.changed if key in self.entries]
+        removed = list(self.removed)
+        self.changed = set()
+        self.removed = set()
+        return changed, removed
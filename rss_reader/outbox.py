@@ -0,0 +1,141 @@
+import asyncio
+from typing import Awaitable, Callable
+
+from interactions import Embed, User
+from interactions.client.errors import HTTPException
+import sentry_sdk
+
+from rss_reader.store import FeedStore
+
+# Discord's limits for a single message.
+MAX_EMBEDS = 10
+MAX_CONTENT = 2000
+MAX_EMBED_CHARS = 6000
+
+
+class Outbox:
+    """Queue of DMs waiting to be sent, so polling never waits on Discord.
+
+    Messages for a recipient are collected for `window` seconds, then sent in as few messages as Discord allows,
+    one recipient at a time each. A send that fails with a rate limit or server error is retried with exponential backoff,
+    and a merged message Discord rejects is split up so only the message at fault is dropped.
+    Every queued message is in the store until it has been sent, so nothing is lost on restart.
+    """
+
+    def __init__(self, store: FeedStore, fetch_user: Callable[[int], Awaitable[User | None]], window: float = 5.0, backoff: float = 2.0, max_backoff: float = 900.0) -> None:
+        self.store = store
+        self.fetch_user = fetch_user
+        self.window = window
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.queues: dict[int, list[dict]] = {}
+        self.workers: dict[int, asyncio.Task] = {}
+        self.sent = 0
+
+    def start(self) -> int:
+        """Queue whatever was left unsent by the last run. Returns how many messages there were."""
+        messages = self.store.load_outbox()
+        for message in messages:
+            self._queue(message)
+        return len(messages)
+
+    async def put(self, user: int, content: str | None = None, embeds: list[Embed] | None = None) -> None:
+        message = {"user": user, "content": content, "embeds": [embed.to_dict() for embed in embeds or []]}
+        message["id"] = await asyncio.to_thread(self.store.add_outbox, message)
+        self._queue(message)
+
+    def pending(self) -> int:
+        return sum(len(queue) for queue in self.queues.values())
+
+    def _queue(self, message: dict) -> None:
+        user = message["user"]
+        self.queues.setdefault(user, []).append(message)
+        if user not in self.workers:
+            self.workers[user] = asyncio.create_task(self._run(user))
+
+    async def _run(self, user: int) -> None:
+        try:
+            await asyncio.sleep(self.window)
+            attempt = 0
+            while queue := self.queues.get(user):
+                batch = take_batch(queue)
+                try:
+                    await self._send(user, batch)
+                except Exception as e:
+                    # Keep the batch and try again later, rather than leaving the queue without a worker.
+                    delay = min(self.max_backoff, self.backoff * 2**attempt)
+                    attempt += 1
+                    print(f"RSS: sending to {user} failed ({e!r}), retrying in {delay:.0f}s")
+                    sentry_sdk.capture_exception(e)
+                    await asyncio.sleep(delay)
+                    continue
+                attempt = 0
+                del queue[: len(batch)]
+                try:
+                    await asyncio.to_thread(self.store.delete_outbox, [message["id"] for message in batch])
+                except Exception as e:
+                    # Already sent; at worst they are sent again after a restart.
+                    print(e)
+                    sentry_sdk.capture_exception(e)
+            self.queues.pop(user, None)
+        finally:
+            self.workers.pop(user, None)
+
+    async def _send(self, user_id: int, batch: list[dict]) -> None:
+        """Send a batch as one message. If Discord rejects it, send its messages one at a time, so only the bad one is dropped."""
+        error = await self._deliver(user_id, batch)
+        if error is None or len(batch) == 1 or error.status in (403, 404):
+            # Forbidden or missing means the recipient can't be reached, whatever the messages say.
+            return
+        for message in batch:
+            await self._deliver(user_id, [message])
+
+    async def _deliver(self, user_id: int, messages: list[dict]) -> HTTPException | None:
+        """Send messages merged into one, retrying while Discord is rate limiting or unavailable. Returns the error if Discord rejected it."""
+        content = "\n".join(message["content"] for message in messages if message["content"]) or None
+        embeds = [Embed.from_dict(embed) for message in messages for embed in message["embeds"]]
+        attempt = 0
+        while True:
+            try:
+                user = await self.fetch_user(user_id)
+                if user is None:
+                    print(f"RSS: dropping {len(messages)} messages for missing user {user_id}")
+                    return None
+                await user.send(content, embeds=embeds)
+                self.sent += 1
+                return None
+            except HTTPException as e:
+                if e.status != 429 and e.status < 500:
+                    print(f"RSS: Discord rejected {len(messages)} messages for {user_id}: {e}")
+                    if len(messages) == 1:
+                        sentry_sdk.capture_exception(e)
+                    return e
+                error = e
+            except (OSError, asyncio.TimeoutError) as e:
+                error = e
+            delay = min(self.max_backoff, self.backoff * 2**attempt)
+            attempt += 1
+            print(f"RSS: sending to {user_id} failed ({error}), retrying in {delay:.0f}s")
+            await asyncio.sleep(delay)
+
+
+def embed_chars(embed: dict) -> int:
+    """Characters counted towards Discord's per-message embed limit."""
+    total = len(embed.get("title") or "") + len(embed.get("description") or "")
+    total += len((embed.get("footer") or {}).get("text") or "") + len((embed.get("author") or {}).get("name") or "")
+    for field in embed.get("fields") or []:
+        total += len(field.get("name") or "") + len(field.get("value") or "")
+    return total
+
+
+def take_batch(queue: list[dict]) -> list[dict]:
+    """The longest run of messages from the front of `queue` that fit in one Discord message. Always at least one."""
+    content = embeds = chars = 0
+    for i, message in enumerate(queue):
+        if message["content"]:
+            content += len(message["content"]) + 1
+        embeds += len(message["embeds"])
+        chars += sum(embed_chars(embed) for embed in message["embeds"])
+        if i and (content > MAX_CONTENT + 1 or embeds > MAX_EMBEDS or chars > MAX_EMBED_CHARS):
+            return queue[:i]
+    return queue[:]
@@ -1,35 +1,58 @@
-from collections import Counter
-import aiohttp
+import asyncio
+from collections import Counter, defaultdict
+import time
+import urllib.parse
 from bs4 import BeautifulSoup
-from interactions import Client, CronTrigger, Embed, Extension, OptionType, SlashContext, Task, listen, slash_command, slash_option
+from interactions import Client, Embed, Extension, IntervalTrigger, OptionType, SlashContext, Task, listen, slash_command, slash_option
 from interactions.models.discord.components import Button, TextDisplayComponent, SectionComponent
 import feedparser
 import shortuuid
 
-import json
-import os
-
 import sentry_sdk
 
+from rss_reader.classifier import HostClassifier
+from rss_reader.outbox import Outbox
+from rss_reader.scheduler import FeedScheduler, entry_time
+from rss_reader.seen import SeenSet
 from rss_reader.solvers import PatreonException, create_solver
+from rss_reader.store import open_store
 from shared import configuration
+from shared.executor import LoopMonitor, run_parser
+from shared.limited_dict import LRUCache
+
+# Feed keys written by create_solver and the solvers themselves.
+SOLVER_KEYS = ("solver", "img_id", "div_id")
 
 configuration.DEFAULTS.update(
     {
         "rss_max_items": 10,
+        "rss_concurrency": 16,
+        "rss_host_concurrency": 2,
+        # Seconds to collect new items for someone before sending them together.
+        "rss_batch_window": 5,
     }
 )
 
 
 class RssReader(Extension):
     def __init__(self, bot: Client):
-        self.feeds = []
-        if os.path.exists("feeds.json"):
-            with open("feeds.json", "r") as f:
-                self.feeds = json.load(f)
+        self.store, self.feeds = open_store()
+        self.classifier = HostClassifier(self.store.load_solver_hosts())
+        self.users = LRUCache(size_limit=512, ttl=3600)
+        # Original URL -> feed found on that page (or None), so a page that isn't a feed is only searched once in a while.
+        self.discovered = LRUCache(size_limit=256, ttl=6 * 3600)
+        self.outbox = Outbox(self.store, self.fetch_user, window=configuration.get("rss_batch_window"))
+        self.run_stats = Counter()
+        self.scheduler = FeedScheduler()
+        self.polling = asyncio.Lock()
+        # rss_max_items is a per-hour budget, polls happen whenever feeds are due.
+        self.quota = Counter()
+        self.quota_hour = None
 
     @listen()
     async def on_startup(self):
+        if pending := self.outbox.start():
+            print(f"RSS: resending {pending} queued messages")
         self.fetch_feeds.start()
         await self.fetch_feeds()
 
@@ -41,11 +64,24 @@ class RssReader(Extension):
     @slash_option("url", "The URL of the RSS feed", opt_type=OptionType.STRING, required=True)
     async def add_feed(self, ctx: SlashContext, url: str):
         """Subscribe to an RSS feed"""
-        new_feed = {"url": url, "seen": [], "user": ctx.author.id}
+        new_feed = {"url": url, "seen": SeenSet(), "user": ctx.author.id}
         self.feeds.append(new_feed)
-        self.save()
+        await self.save(new_feed)
         await ctx.send("Feed added!", ephemeral=True)
-        await self.check_feed(new_feed)
+        if await self.check_feed(new_feed) is False:
+            self.scheduler.failed(new_feed)
+        else:
+            self.scheduler.succeeded(new_feed)
+        await self.save(new_feed)
+
+    @rss.subcommand("check")
+    async def check(self, ctx: SlashContext):
+        """Check your feeds for new posts now"""
+        mine = [feed for feed in self.feeds if feed.get("user") == ctx.author_id]
+        for feed in mine:
+            self.scheduler.expedite(feed)
+        await ctx.send(f"Checking {len(mine)} feeds...", ephemeral=True)
+        await self.fetch_feeds()
 
     @rss.subcommand("dashboard")
     async def dashboard(self, ctx: SlashContext):
@@ -69,82 +105,244 @@ class RssReader(Extension):
         for msg in chunk(components, 40 // 3):
             await ctx.send(components=msg, ephemeral=True)
 
-    def save(self):
-        dump = json.dumps(self.feeds, indent=2)
-        with open("feeds.json", "w") as f:
-            f.write(dump)
+    async def fetch_user(self, user_id: int):
+        return await self.users.get_or_load(user_id, lambda: self.bot.fetch_user(user_id))
+
+    async def save(self, feed: dict):
+        row = self.store.snapshot(feed)
+        try:
+            await asyncio.to_thread(self.store.write, row)
+        except Exception:
+            self.store.restore(feed, row)
+            raise
 
-    @Task.create(CronTrigger("0 * * * *"))
+    @Task.create(IntervalTrigger(minutes=1))
     async def fetch_feeds(self):
-        counter = Counter()
-        count = 0
+        async with self.polling:
+            await self.poll_due_feeds()
+
+    async def poll_due_feeds(self):
+        hour = int(time.time() // 3600)
+        if hour != self.quota_hour:
+            self.quota = Counter()
+            self.quota_hour = hour
+        quota = self.quota
+        max_items = configuration.get("rss_max_items")
+        # Anyone over budget stays due, and is picked up once the budget resets. They don't make their feed due meanwhile.
+        due = [feed for feed in self.scheduler.due(self.feeds) if quota[feed.get("user")] < max_items]
+        if not due:
+            return
+        started = time.perf_counter()
+        monitor = LoopMonitor()
+        monitor.start()
+        self.run_stats = Counter()
+        limit = asyncio.Semaphore(configuration.get("rss_concurrency"))
+        host_limit = configuration.get("rss_host_concurrency")
+        hosts = defaultdict(lambda: asyncio.Semaphore(host_limit))
+        timings = {}
+        errors = 0
+
+        # Every subscription to a due feed is checked along with it, so each feed URL is only fetched once.
+        groups = defaultdict(list)
         for feed in self.feeds:
-            owner = feed.get("user")
-            if counter[owner] >= configuration.get("rss_max_items"):
-                continue
+            groups[normalize_url(feed["url"])].append(feed)
+        # In the order `due` has them, most overdue first.
+        due_groups = [groups[key] for key in dict.fromkeys(normalize_url(feed["url"]) for feed in due)]
+
+        async def run(group: list[dict]) -> int:
+            nonlocal errors
+            # Take the host slot first, so feeds queued behind a slow host don't hold global slots.
+            async with hosts[urllib.parse.urlparse(group[0]["url"]).hostname], limit:
+                # The quota may have run out while this group waited for a slot.
+                active = [feed for feed in group if quota[feed.get("user")] < max_items]
+                if not active:
+                    return 0
+                start = time.perf_counter()
+                try:
+                    results = await self.check_feeds(active, quota)
+                except Exception as e:
+                    errors += 1
+                    results = [False] * len(active)
+                    print(e)
+                    sentry_sdk.capture_exception(e)
+                finally:
+                    timings[group[0]["url"]] = time.perf_counter() - start
+                for feed, result in zip(active, results):
+                    if result is False:
+                        self.scheduler.failed(feed)
+                    else:
+                        self.scheduler.succeeded(feed)
+                return sum(results)
+
+        async def run_and_save(group: list[dict]) -> int:
             try:
-                count = count + await self.check_feed(feed)
-            except Exception as e:
-                print(e)
-                sentry_sdk.capture_exception(e)
-            counter[owner] += count
-        if count > 0:
-            self.save()
+                return await run(group)
+            finally:
+                for feed in group:
+                    await self.save(feed)
 
-    async def check_feed(self, feed: dict) -> int:
-        url = feed["url"]
-        user = await self.bot.fetch_user(feed["user"])
-        seen = feed["seen"]
-        if user is None:
-            return False
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as resp:
-                data = await resp.text(errors="ignore")
+        count = sum(await asyncio.gather(*(run_and_save(group) for group in due_groups)))
+        await asyncio.to_thread(self.store.write_solver_hosts, self.classifier.drain_changes())
+        elapsed = time.perf_counter() - started
+        lag = monitor.stop()
+        summary = f"RSS: checked {len(timings)}/{len(due_groups)} due feed URLs ({len(due)} subscriptions) in {elapsed:.1f}s, {count} new items, {errors} errors"
+        if timings:
+            slowest = max(timings, key=timings.get)
+            summary += f", slowest {slowest} ({timings[slowest]:.1f}s)"
+        print(summary)
+        print(f"RSS: {self.run_stats['fetched']} full fetches, {self.run_stats['not_modified']} not modified, {self.run_stats['full_scans']} subscriptions scanned every entry")
+        print(f"RSS: event loop lag max {lag['max_ms']:.0f}ms, p99 {lag['p99_ms']:.0f}ms over {lag['samples']} samples")
+        print(f"RSS: HTTP {self.bot.http_client.stats()}")
+        print(f"RSS: {self.outbox.pending()} messages queued, {self.outbox.sent} sent so far")
+
+    async def check_feed(self, feed: dict, quota: Counter | None = None) -> int:
+        """Check a single subscription for new items."""
+        return (await self.check_feeds([feed], quota))[0]
+
+    async def check_feeds(self, feeds: list[dict], quota: Counter | None = None) -> list[int | bool]:
+        """Check subscriptions that share a feed URL for new items.
+
+        The feed is downloaded and parsed once and each new item is solved once, then delivered to every subscriber that hasn't seen it.
+        Returns the number of items sent for each subscription, or False if it couldn't be checked.
+        Items sent are counted against the owner's `rss_max_items` in `quota`, if given.
+        """
+        lead = feeds[0]
+        url = lead["url"]
+        headers = {}
+        # Only ask for a 304 if every subscriber was last updated from the same version of the feed.
+        if len({(feed.get("etag"), feed.get("last_modified")) for feed in feeds}) == 1:
+            if lead.get("etag"):
+                headers["If-None-Match"] = lead["etag"]
+            if lead.get("last_modified"):
+                headers["If-Modified-Since"] = lead["last_modified"]
+        async with self.bot.http_client.get(url, headers=headers) as resp:
+            if resp.status == 304:
+                self.run_stats["not_modified"] += 1
+                return [0] * len(feeds)
+            data = await resp.text(errors="ignore")
+            validators = {"etag": resp.headers.get("ETag"), "last_modified": resp.headers.get("Last-Modified")}
+        self.run_stats["fetched"] += 1
 
-        rss = feedparser.parse(data)
+        rss = await run_parser(parse_feed, data)
         if rss.bozo == 1:
-            rss = await self.find_rss_feed(feed, rss)
+            rss = await self.find_rss_feed(lead, rss, data)
         if rss.bozo:
-            return False
-        feed["title"] = rss.feed.title
-        if "image" in rss.feed:
-            feed["image"] = rss.feed.image.href
-        solver = create_solver(feed, rss.feed, rss.entries)
+            return [False] * len(feeds)
+        self.scheduler.learn(lead, rss.entries)
+        solver = create_solver(lead, rss.feed, rss.entries, self.bot.http_client, self.classifier)
+        for feed in feeds:
+            feed["url"] = lead["url"]
+            if "interval" in lead:
+                feed["interval"] = lead["interval"]
+            feed["title"] = rss.feed.title
+            if "image" in rss.feed:
+                feed["image"] = rss.feed.image.href
 
         items = rss.entries
         if not items:
             updated = rss.feed.updated
-            if feed.get("latest") and feed["latest"].get("published") == updated:
-                return 0
-            feed.setdefault("latest", {})["published"] = updated
-            # solver.solve()
-            return 0
-        if hasattr(items[0], "published_parsed"):
-            items.sort(key=lambda x: x.published_parsed, reverse=False)
-        else:
-            # We want oldest first, and feeds are usually newest first
-            items.reverse()
+            for feed in feeds:
+                if not feed.get("latest") or feed["latest"].get("published") != updated:
+                    feed.setdefault("latest", {})["published"] = updated
+                # solver.solve()
+                update_validators(feed, url, validators)
+            return [0] * len(feeds)
+
+        everything = None
+
+        def all_items() -> list:
+            # Only needed by feeds without a usable high-water mark, so only sorted for them.
+            nonlocal everything
+            if everything is None:
+                everything = list(items)
+                if hasattr(everything[0], "published_parsed"):
+                    everything.sort(key=lambda x: x.published_parsed, reverse=False)
+                else:
+                    # We want oldest first, and feeds are usually newest first
+                    everything.reverse()
+            return everything
+
+        solved = {}
+
+        async def solve(item: feedparser.FeedParserDict, guid: str) -> tuple[object, str | None]:
+            """Solve each item once, however many subscribers need it. Failures are remembered too, so they're only attempted once."""
+            if guid not in solved:
+                try:
+                    solved[guid] = (await solver.solve(item), solver.url)
+                except Exception as e:
+                    solved[guid] = (e, None)
+            content, page_url = solved[guid]
+            if isinstance(content, Exception):
+                raise content
+            return content, page_url
+
+        results = []
+        for feed in feeds:
+            new = new_entries(items, feed.get("hwm"))
+            if new is None:
+                self.run_stats["full_scans"] += 1
+                new = all_items()
+            try:
+                result = await self.deliver(feed, rss, new, solve, quota)
+            except Exception as e:
+                result = False
+                print(e)
+                sentry_sdk.capture_exception(e)
+            if result is not False and result[1]:
+                update_validators(feed, url, validators)
+                # Everything up to here has been delivered, so next time only newer entries need looking at.
+                if new and (hwm := high_water_mark(new[-1])):
+                    feed["hwm"] = hwm
+            results.append(result if result is False else result[0])
+        # The solver may have been upgraded while solving, and every subscriber should use it next time.
+        for feed in feeds[1:]:
+            for key in SOLVER_KEYS:
+                if key in lead:
+                    feed[key] = lead[key]
+        return results
+
+    async def deliver(self, feed: dict, rss: feedparser.FeedParserDict, items: list, solve, quota: Counter | None) -> tuple[int, bool] | bool:
+        """Queue the items, oldest first, that one subscriber hasn't seen. Returns how many were queued and whether none were left for later, or False if the user is gone."""
+        user = await self.fetch_user(feed["user"])
+        if user is None:
+            return False
+        seen = feed["seen"]
         count = 0
+        failed = False
+        # A locked post is delivered for real once it goes public, so it counts as left for later.
+        locked = False
+        max_items = configuration.get("rss_max_items")
         for item in items:
+            reserved = False
             try:
-                guid = item.get("guid", item.get("id", item.get("link")))
+                guid = entry_guid(item)
                 if guid in seen:
                     continue
+                if quota is not None:
+                    if quota[feed["user"]] >= max_items:
+                        break
+                    # Take the slot before awaiting, so other feeds of this user running meanwhile see it as used.
+                    quota[feed["user"]] += 1
+                    reserved = True
                 published = item.get("published", rss.feed.get("updated"))
                 feed["latest"] = {"guid": guid, "title": item.title, "published": published, "url": item.links[0].href}
                 try:
-                    content = await solver.solve(item)
+                    content, page_url = await solve(item, guid)
                 except PatreonException:
+                    locked = True
+                    if reserved:
+                        quota[feed["user"]] -= 1
+                        reserved = False
                     pguid = f"PATREON-{guid}"
                     if pguid in seen:
                         continue
-                    await user.send(f"New [Patreon-exclusive post](<{item.links[0].href}>) in {rss.feed.title}, but it's locked behind a Patreon paywall.")
-                    seen.append(pguid)
+                    await self.outbox.put(feed["user"], f"New [Patreon-exclusive post](<{item.links[0].href}>) in {rss.feed.title}, but it's locked behind a Patreon paywall.")
+                    seen.add(pguid)
                     continue
                 if isinstance(content, str):
-                    await user.send(content)
+                    await self.outbox.put(feed["user"], content)
                 elif isinstance(content, Embed):
-                    await user.send(embed=content)
+                    await self.outbox.put(feed["user"], embeds=[content])
                 elif isinstance(content, (list, tuple)):
                     body = None
                     embeds = []
@@ -153,44 +351,119 @@ class RssReader(Extension):
                             body = c
                         elif isinstance(c, Embed):
                             embeds.append(c)
-                    await user.send(body, embeds=embeds)
-                seen.append(guid)
-                if solver.url and solver.url not in seen:
-                    seen.append(solver.url)
-                if len(seen) > len(items) * 4:
-                    seen.pop(0)
+                    await self.outbox.put(feed["user"], body, embeds)
+                reserved = False
+                seen.add(guid)
+                if page_url and page_url not in seen:
+                    seen.add(page_url)
+                if len(seen) > len(rss.entries) * 4:
+                    seen.evict_oldest()
                 count += 1
                 if count >= 10:
                     break
             except Exception as e:
+                if reserved:
+                    quota[feed["user"]] -= 1
+                failed = True
                 print(e)
                 sentry_sdk.capture_exception(e)
-        return count
-
-    async def find_rss_feed(self, feed, rss):
-        async with aiohttp.ClientSession() as session:
-            async with session.get(feed["url"]) as resp:
-                data = await resp.text()
-        soup = BeautifulSoup(data, "html.parser")
-        links = soup.find_all("link", type="application/rss+xml")
-        if links:
-            link = links[0]["href"]
-            if link.startswith("//"):
-                link = "https:" + link
-            feed["url"] = link
-            async with aiohttp.ClientSession() as session:
-                async with session.get(link) as resp:
-                    data = await resp.text()
-            return feedparser.parse(data)
-        if feed["url"].startswith("https://mangadex.org/title/"):
-            uuid = feed["url"].split("/")[4]
-            link = f"https://mdrss.tijlvdb.me/feed?q=manga:{uuid},tl:en"
-            feed["url"] = link
-            async with aiohttp.ClientSession() as session:
-                async with session.get(link) as resp:
-                    data = await resp.text()
-            return feedparser.parse(data)
-        return rss
+        else:
+            # Only skip the next download if nothing was left behind for a later run.
+            return count, not failed and not locked
+        return count, False
+
+    async def find_rss_feed(self, feed: dict, rss: feedparser.FeedParserDict, data: str) -> feedparser.FeedParserDict:
+        """Look for the real feed in `data`, the page already downloaded from `feed["url"]`, and switch the feed over to it."""
+        link = await self.discovered.get_or_load(normalize_url(feed["url"]), lambda: run_parser(discover_feed, feed["url"], data))
+        if not link:
+            return rss
+        feed["url"] = link
+        async with self.bot.http_client.get(link) as resp:
+            data = await resp.text(errors="ignore")
+        return await run_parser(parse_feed, data)
+
+
+def parse_feed(data: str) -> feedparser.FeedParserDict:
+    rss = feedparser.parse(data)
+    # Parser exceptions don't always pickle, and only `bozo` itself is used.
+    if "bozo_exception" in rss:
+        rss["bozo_exception"] = repr(rss["bozo_exception"])
+    return rss
+
+
+def find_feed_links(html: str) -> list[str]:
+    soup = BeautifulSoup(html, "html.parser")
+    return [link["href"] for link in soup.find_all("link", type="application/rss+xml")]
+
+
+def discover_feed(url: str, html: str) -> str | None:
+    """The feed a page links to, if it has one."""
+    links = find_feed_links(html)
+    if links:
+        link = links[0]
+        if link.startswith("//"):
+            link = "https:" + link
+        return urllib.parse.urljoin(url, link)
+    if url.startswith("https://mangadex.org/title/"):
+        uuid = url.split("/")[4]
+        return f"https://mdrss.tijlvdb.me/feed?q=manga:{uuid},tl:en"
+    return None
+
+
+def entry_guid(entry: feedparser.FeedParserDict) -> str:
+    return entry.get("guid", entry.get("id", entry.get("link")))
+
+
+def high_water_mark(entry: feedparser.FeedParserDict) -> dict | None:
+    published = entry_time(entry)
+    if published is None:
+        return None
+    return {"published": published, "guid": entry_guid(entry)}
+
+
+def new_entries(entries: list, hwm: dict | None) -> list | None:
+    """Entries newer than the high-water mark `hwm`, oldest first.
+
+    Walks from the newest end of the feed and stops at the first entry that isn't newer, so a long archive feed costs only
+    as much as its new entries. Returns None when there's no mark yet, or the feed's dates can't be trusted for this
+    (an entry without a date, or entries out of order); the caller then checks every entry against `seen` as before.
+    """
+    if not hwm or not entries:
+        return None
+    first, last = entry_time(entries[0]), entry_time(entries[-1])
+    if first is None or last is None:
+        return None
+    newest_first = entries if first >= last else reversed(entries)
+    new = []
+    previous = None
+    for entry in newest_first:
+        published = entry_time(entry)
+        if published is None or (previous is not None and published > previous):
+            return None
+        if published < hwm["published"] or (published == hwm["published"] and entry_guid(entry) == hwm["guid"]):
+            break
+        new.append(entry)
+        previous = published
+    new.reverse()
+    return new
+
+
+def normalize_url(url: str) -> str:
+    """Key for subscriptions that are really the same feed."""
+    parts = urllib.parse.urlsplit(url.strip())
+    path = parts.path.rstrip("/") or "/"
+    return urllib.parse.urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, parts.query, ""))
+
+
+def update_validators(feed: dict, url: str, validators: dict) -> None:
+    """Remember the response's cache validators, unless the feed moved to a different URL while being checked."""
+    if feed["url"] != url:
+        return
+    for key, value in validators.items():
+        if value:
+            feed[key] = value
+        else:
+            feed.pop(key, None)
 
 
 def chunk(lst, n):
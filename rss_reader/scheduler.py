@@ -0,0 +1,74 @@
+import calendar
+import random
+import statistics
+import time
+
+from feedparser import FeedParserDict
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+
+MIN_INTERVAL = 15 * MINUTE
+MAX_INTERVAL = 3 * HOUR
+DEFAULT_INTERVAL = HOUR
+# Feeds that haven't posted in this long get polled once a day.
+DEAD_AFTER = 30 * DAY
+MAX_BACKOFF = DAY
+
+
+def entry_time(entry: FeedParserDict) -> float | None:
+    parsed = entry.get("published_parsed") or entry.get("updated_parsed")
+    if not parsed:
+        return None
+    return calendar.timegm(parsed)
+
+
+class FeedScheduler:
+    """Decides when each feed is polled next.
+
+    The schedule is kept on the feed dict (`next_check`, `interval`, `failures`) so it survives restarts.
+    A feed is polled about four times per typical gap between its posts, within MIN_INTERVAL..MAX_INTERVAL.
+    """
+
+    def __init__(self, jitter: float = 0.1, clock=time.time) -> None:
+        self.jitter = jitter
+        self.clock = clock
+
+    def due(self, feeds: list[dict]) -> list[dict]:
+        """Feeds that should be polled now, most overdue first. Feeds never seen before are spread over the next interval."""
+        now = self.clock()
+        for feed in feeds:
+            if "next_check" not in feed:
+                feed["next_check"] = now + random.uniform(0, feed.get("interval", DEFAULT_INTERVAL))
+        due = [feed for feed in feeds if feed["next_check"] <= now]
+        due.sort(key=lambda feed: feed["next_check"])
+        return due
+
+    def expedite(self, feed: dict) -> None:
+        feed["next_check"] = 0
+
+    def learn(self, feed: dict, entries: list[FeedParserDict]) -> None:
+        """Estimate how often the feed posts from its entries' timestamps."""
+        times = sorted(t for t in (entry_time(entry) for entry in entries) if t is not None)
+        if not times:
+            return
+        if self.clock() - times[-1] > DEAD_AFTER:
+            feed["interval"] = DAY
+            return
+        gaps = [b - a for a, b in zip(times, times[1:]) if b > a]
+        if not gaps:
+            return
+        feed["interval"] = min(max(statistics.median(gaps) / 4, MIN_INTERVAL), MAX_INTERVAL)
+
+    def succeeded(self, feed: dict) -> None:
+        feed["failures"] = 0
+        self._schedule(feed, feed.get("interval", DEFAULT_INTERVAL))
+
+    def failed(self, feed: dict) -> None:
+        feed["failures"] = feed.get("failures", 0) + 1
+        delay = feed.get("interval", DEFAULT_INTERVAL) * 2 ** feed["failures"]
+        self._schedule(feed, min(delay, MAX_BACKOFF))
+
+    def _schedule(self, feed: dict, delay: float) -> None:
+        feed["next_check"] = self.clock() + delay * random.uniform(1 - self.jitter, 1 + self.jitter)
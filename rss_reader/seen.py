@@ -0,0 +1,61 @@
+from collections import OrderedDict
+from typing import Iterable, Iterator
+
+
+class SeenSet:
+    """GUIDs already delivered for a feed, oldest first.
+
+    Membership and eviction of the oldest GUID are O(1). Serializes to a plain list, so older feeds.json files load unchanged.
+    Adds and evictions since the last `drain_changes()` are tracked so storage can be updated incrementally.
+    """
+
+    __slots__ = ("items", "changes")
+
+    def __init__(self, items: Iterable[str] = (), dirty: bool = False) -> None:
+        self.items: OrderedDict[str, None] = OrderedDict.fromkeys(items)
+        # guid -> True if added, False if evicted; only the last operation matters.
+        self.changes: dict[str, bool] = dict.fromkeys(self.items, True) if dirty else {}
+
+    def __contains__(self, guid: str) -> bool:
+        return guid in self.items
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.items)
+
+    def add(self, guid: str) -> None:
+        if guid in self.items:
+            return
+        self.items[guid] = None
+        self.changes[guid] = True
+
+    def evict_oldest(self) -> str:
+        guid = self.items.popitem(last=False)[0]
+        self.changes[guid] = False
+        return guid
+
+    def drain_changes(self) -> tuple[list[str], list[str]]:
+        """Return (added, evicted) since the last call."""
+        added = [guid for guid, present in self.changes.items() if present]
+        evicted = [guid for guid, present in self.changes.items() if not present]
+        self.changes = {}
+        return added, evicted
+
+    def restore_changes(self, added: list[str], evicted: list[str]) -> None:
+        """Put back changes from `drain_changes()` that couldn't be stored. Anything changed again since then is newer and kept."""
+        for guid in added:
+            self.changes.setdefault(guid, True)
+        for guid in evicted:
+            self.changes.setdefault(guid, False)
+
+    def to_json(self) -> list[str]:
+        return list(self.items)
+
+
+def to_json(obj: object) -> object:
+    """`default` hook for json.dumps."""
+    if isinstance(obj, SeenSet):
+        return obj.to_json()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
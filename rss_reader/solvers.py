@@ -1,16 +1,20 @@
-import aiohttp
-from bs4 import BeautifulSoup, Tag
+from bs4 import BeautifulSoup, SoupStrainer
 from feedparser import FeedParserDict
 import urllib.parse
+from collections import Counter
 from markdownify import markdownify
 
 from interactions import Embed
 import sentry_sdk
 
+from rss_reader.classifier import HostClassifier
+from shared.executor import run_parser
+from shared.http import HttpClient
+
 class PatreonException(Exception):
     """Post is locked behind a Patreon paywall."""
 
-def create_solver(feed: dict, channel: FeedParserDict, entries: list[FeedParserDict]) -> "DefaultSolver":
+def create_solver(feed: dict, channel: FeedParserDict, entries: list[FeedParserDict], http: HttpClient, classifier: HostClassifier | None = None) -> "DefaultSolver":
     if channel.get("generator") and channel["generator"].startswith("https://wordpress.org/"):
         feed["solver"] = "WordpressSolver"
     elif channel.link.startswith("https://www.comic-rocket.com/feeds/"):
@@ -30,24 +34,68 @@ def create_solver(feed: dict, channel: FeedParserDict, entries: list[FeedParserD
             feed["solver"] = "ImgIdSolver"
             feed["img_id"] = "cc-comic"
 
+    if classifier and entries and feed.get("solver") in (None, "DefaultSolver", "UnknownSolver"):
+        # Another feed on the same site has already been probed; skip straight to what worked there.
+        hint = classifier.lookup(entries[0].link)
+        if hint:
+            feed.update(hint)
+
+    solver: DefaultSolver
     if feed.get("solver") and feed["solver"] != "DefaultSolver":
         solver_class = globals().get(feed["solver"], None)
         if not solver_class:
             feed["solver"] = "DefaultSolver"
-            return UnknownSolver(feed, channel)
-        return solver_class(feed, channel)
+            solver = UnknownSolver(feed, channel, http)
+        else:
+            solver = solver_class(feed, channel, http)
+    else:
+        solver = UnknownSolver(feed, channel, http)
+    solver.classifier = classifier
+    return solver
+
+
+class Page:
+    """An item's page, downloaded once, however many solvers look at it.
+
+    Extraction runs through the parse executor, and each extraction's result is kept so it's only done once per page.
+    """
+
+    def __init__(self, url: str, html: str) -> None:
+        self.url = url
+        self.html = html
+        self.results: dict[tuple, object] = {}
 
-    return UnknownSolver(feed, channel)
+    async def extract(self, func, *args):
+        key = (func, args)
+        if key not in self.results:
+            self.results[key] = await run_parser(func, self.html, *args)
+        return self.results[key]
 
 
 class DefaultSolver:
-    def __init__(self, feed: dict, channel: FeedParserDict) -> None:
+    def __init__(self, feed: dict, channel: FeedParserDict, http: HttpClient) -> None:
         self.feed = feed
         self.channel = channel
+        self.http = http
+        self.url = None
+        # Item link -> fetched page, shared with any solver this one hands over to.
+        self.pages: dict[str, Page] = {}
+        # Requests made per URL, so repeated downloads are easy to spot.
+        self.fetches: Counter[str] = Counter()
+        # Shared record of which solver works on which site, if the caller keeps one.
+        self.classifier: HostClassifier | None = None
+
+    def delegate(self, solver_class: type["DefaultSolver"]) -> "DefaultSolver":
+        """Create another solver for this feed that reuses the pages already fetched."""
+        solver = solver_class(self.feed, self.channel, self.http)
+        solver.pages = self.pages
+        solver.fetches = self.fetches
+        solver.classifier = self.classifier
+        return solver
 
     async def solve(self, item: FeedParserDict) -> str | Embed | tuple[str, Embed] | list[Embed]:
-        await self.fetch_link(item)
-        return self.format_message(item, self.url, None)
+        page = await self.fetch_page(item)
+        return self.format_message(item, page.url, None)
 
     def format_message(self, item: FeedParserDict, page_url: str, img_url: str) -> str:
         post = "post"
@@ -81,138 +129,275 @@ class DefaultSolver:
 
     async def fetch_link(self, item: FeedParserDict) -> str:
         """Fetches the link of the item and returns the content."""
-        self.url = item.links[0].href
-        async with aiohttp.ClientSession() as session:
-            async with session.get(self.url) as resp:
-                data = await resp.text()
+        return (await self.fetch_page(item)).html
+
+    async def fetch_page(self, item: FeedParserDict) -> Page:
+        link = item.links[0].href
+        page = self.pages.get(link)
+        if page is None:
+            page = self.pages[link] = await self.download(link)
+        self.url = page.url
+        return page
 
-            if self.url.startswith("https://www.comic-rocket.com/"):
-                soup = BeautifulSoup(data, "html.parser")
-                body = soup.find("div", id="serialpagebody")
-                iframe = body.find("iframe")
-                self.url = iframe["src"]
-                async with session.get(self.url) as resp:
-                    data = (await resp.read()).decode("utf-8", errors="ignore")
+    async def get(self, url: str, lenient: bool = False) -> str:
+        self.fetches[url] += 1
+        async with self.http.get(url) as resp:
+            if lenient:
+                return (await resp.read()).decode("utf-8", errors="ignore")
+            return await resp.text()
 
-        return data
+    async def download(self, url: str) -> Page:
+        page = Page(url, await self.get(url))
+        if url.startswith("https://www.comic-rocket.com/"):
+            url = await page.extract(find_iframe)
+            page = Page(url, await self.get(url, lenient=True))
+        return page
 
 
 class WordpressSolver(DefaultSolver):
     async def solve(self, item: FeedParserDict) -> str:
-        content = await self.fetch_link(item)
-        soup = BeautifulSoup(content, "html.parser")
-        post = soup.find("div", class_="entry-content")
-        image = post.find("img")
+        page = await self.fetch_page(item)
+        image = await page.extract(extract_wordpress)
         if image:
-            if image.get('alt') == 'Unlock with Patreon':
+            if image["alt"] == 'Unlock with Patreon':
                 raise PatreonException()
-            image = image["src"]
-            return self.format_message(item, item.links[0].href, image)
+            return self.format_message(item, item.links[0].href, image["src"])
         return self.format_message(item, item.links[0].href, None)
 
 
 class FreefallSolver(DefaultSolver):
     async def solve(self, item: FeedParserDict) -> str:
-        data = await self.fetch_link(item)
-        soup = BeautifulSoup(data, "html.parser")
-        img = soup.find("img")
+        page = await self.fetch_page(item)
+        src = await page.extract(extract_first_img)
 
-        url = urllib.parse.urljoin(self.url, img["src"])
+        url = urllib.parse.urljoin(page.url, src)
 
-        return self.format_message(item, self.url, url)
+        return self.format_message(item, page.url, url)
 
 
 class ImgIdSolver(DefaultSolver):
     async def solve(self, item: FeedParserDict) -> str | list[Embed]:
-        fallback = await super().solve(item)
+        page = await self.fetch_page(item)
+        fallback = self.format_message(item, page.url, None)
         try:
-            content = await self.fetch_link(item)
-            soup = BeautifulSoup(content, "html.parser")
-            img = soup.find("img", id=self.feed["img_id"])
-            if img is None:
+            comic = await page.extract(extract_img_id, self.feed["img_id"], page.url)
+            if comic is None:
                 self.feed["solver"] = "UnknownSolver"
+                if self.classifier:
+                    self.classifier.invalidate(item.links[0].href)
                 return fallback
-            url = urllib.parse.urljoin(self.url, img["src"])
-            title = img.get("title")
-            storyline = soup.find("select", {"name": "comic-storyline"})
-            if storyline:
-                storyline = storyline.find("option", selected=True)
-                if storyline:
-                    title = f"{title} - {storyline.text.strip()}"
-            newsbody = soup.find("div", class_="cc-newsbody")
-            if not newsbody:
-                newsbody = soup.find("div", id="newspost")
+            if self.classifier:
+                self.classifier.confirm(item.links[0].href, "ImgIdSolver", "img_id", self.feed["img_id"])
+            url = comic["src"]
+            title = comic["title"]
             embeds = []
             if title:
-                embeds.append(self.format_embed(item, self.url, url, title))
-            elif newsbody:
-                embeds.append(self.format_embed(item, self.url, url, None))
+                embeds.append(self.format_embed(item, page.url, url, title))
+            elif comic["has_news"]:
+                embeds.append(self.format_embed(item, page.url, url, None))
 
-            if newsbody:
-                embeds.append(await self.parse_newsbody(newsbody))
+            if comic["news"]:
+                embeds.append(news_embed(comic["news"]))
             if embeds:
                 return embeds
-            return self.format_message(item, self.url, url)
+            return self.format_message(item, page.url, url)
         except UnicodeDecodeError as e:
             sentry_sdk.capture_exception(e)
             return fallback
 
-    async def parse_newsbody(self, newsbody: Tag) -> Embed:
-        links = newsbody.find_all("a")
-        for link in links:
-            if link["href"].startswith("/"):
-                link["href"] = urllib.parse.urljoin(self.url, link["href"])
-        md = markdownify(str(newsbody))
-        if not md:
-            return None
-        if len(md) > 4096:
-            return Embed(description=md[:4090] + "...")
-        return Embed(description=md)
-
 
 class DivIdSolver(DefaultSolver):
     async def solve(self, item: FeedParserDict) -> str | Embed | tuple[str, Embed] | list[Embed]:
-        fallback = await super().solve(item)
+        page = await self.fetch_page(item)
+        fallback = self.format_message(item, page.url, None)
         try:
-            content = await self.fetch_link(item)
-            soup = BeautifulSoup(content, "html.parser")
-            div = soup.find("div", id=self.feed["div_id"])
-            if div:
-                img = div.find("img")
-                if img:
-                    image = img["src"]
-                    title = img.get("title")
-                    return self.format_embed(item, item.links[0].href, image, title)
+            img = await page.extract(extract_div_img, self.feed["div_id"])
+            if img:
+                if self.classifier:
+                    self.classifier.confirm(item.links[0].href, "DivIdSolver", "div_id", self.feed["div_id"])
+                return self.format_embed(item, item.links[0].href, img["src"], img["title"])
+            self.feed["solver"] = "UnknownSolver"
+            if self.classifier:
+                self.classifier.invalidate(item.links[0].href)
             return self.format_message(item, item.links[0].href, None)
         except UnicodeDecodeError as e:
             sentry_sdk.capture_exception(e)
             return fallback
 
 class UnknownSolver(DefaultSolver):
+    def __init__(self, feed: dict, channel: FeedParserDict, http: HttpClient) -> None:
+        super().__init__(feed, channel, http)
+        self.resolved: DefaultSolver | None = None
+
     async def solve(self, item: FeedParserDict) -> str | Embed | tuple[str, Embed] | list[Embed]:
+        if self.resolved is not None:
+            return await self.solve_with(self.resolved, item)
         try:
-            content = await self.fetch_link(item)
-            soup = BeautifulSoup(content, "html.parser")
-            comic = soup.find("img", id="cc-comic")
-            if comic:
-                self.feed["solver"] = "ImgIdSolver"
-                self.feed["img_id"] = "cc-comic"
-                return await ImgIdSolver(self.feed, self.channel).solve(item)
-            comic = soup.find("img", id="comic-image")
-            if comic:
-                self.feed["solver"] = "ImgIdSolver"
-                self.feed["img_id"] = "comic-image"
-                return await ImgIdSolver(self.feed, self.channel).solve(item)
-            comic = soup.find("img", id="strip")
-            if comic:
-                self.feed["solver"] = "ImgIdSolver"
-                self.feed["img_id"] = "strip"
-                return await ImgIdSolver(self.feed, self.channel).solve(item)
-            div = soup.find("div", id="comic")
-            if div:
-                self.feed["solver"] = "DivIdSolver"
-                self.feed["div_id"] = "comic"
-                return await DivIdSolver(self.feed, self.channel).solve(item)
+            page = await self.fetch_page(item)
+            found = await page.extract(probe, page.url)
+            if found:
+                solver_name, key, value, data = found
+                self.feed["solver"] = solver_name
+                self.feed[key] = value
+                # The probe already extracted what the detected solver needs from this page.
+                if solver_name == "ImgIdSolver":
+                    page.results[(extract_img_id, (value, page.url))] = data
+                    return await self.solve_with(self.delegate(ImgIdSolver), item)
+                page.results[(extract_div_img, (value,))] = data
+                return await self.solve_with(self.delegate(DivIdSolver), item)
         except Exception as e:
             sentry_sdk.capture_exception(e)
         return await super().solve(item)
+
+    async def solve_with(self, solver: DefaultSolver, item: FeedParserDict) -> str | Embed | tuple[str, Embed] | list[Embed]:
+        """Solve with the detected solver, and keep using it for the rest of this feed's items."""
+        self.resolved = solver
+        try:
+            return await solver.solve(item)
+        finally:
+            self.url = solver.url
+
+
+def news_embed(md: str) -> Embed:
+    if len(md) > 4096:
+        return Embed(description=md[:4090] + "...")
+    return Embed(description=md)
+
+
+# Extraction runs in the parse executor (possibly another process), so these are module-level functions
+# that take the page's HTML and return plain data.
+
+try:
+    import lxml  # noqa: F401
+
+    HTML_FEATURES = "lxml"
+except ImportError:
+    HTML_FEATURES = "html.parser"
+# Switched off by the solver benchmark to compare against parsing everything.
+USE_TARGETS = True
+
+
+class Targets(SoupStrainer):
+    """Keep only elements matching one of `targets`, and everything inside them.
+
+    Each target is (tag, attribute, value); a class attribute matches any one of the element's classes, and an attribute of None matches any element with that tag.
+    """
+
+    def __init__(self, *targets: tuple[str, str | None, str | None]) -> None:
+        super().__init__(name=sorted({tag for tag, _, _ in targets}))
+        self.targets = targets
+
+    def wants(self, name: str, attrs) -> bool:
+        if attrs and not isinstance(attrs, dict):
+            attrs = dict(attrs)
+        for tag, attr, value in self.targets:
+            if tag != name:
+                continue
+            if attr is None:
+                return True
+            found = (attrs or {}).get(attr)
+            if isinstance(found, (list, tuple)):
+                found = " ".join(found)
+            if found is None:
+                continue
+            if found == value or (attr == "class" and value in found.split()):
+                return True
+        return False
+
+    def allow_tag_creation(self, nsprefix, name, attrs) -> bool:
+        # beautifulsoup4 >= 4.13
+        return self.wants(name, attrs)
+
+    def search_tag(self, markup_name=None, markup_attrs={}):
+        # beautifulsoup4 < 4.13
+        name = getattr(markup_name, "name", markup_name)
+        attrs = getattr(markup_name, "attrs", markup_attrs)
+        return markup_name if self.wants(name, attrs) else None
+
+
+# The elements each solver looks at.
+COMIC_ROCKET_TARGETS = Targets(("div", "id", "serialpagebody"))
+WORDPRESS_TARGETS = Targets(("div", "class", "entry-content"))
+FREEFALL_TARGETS = Targets(("img", None, None))
+IMG_ID_EXTRAS = (("select", "name", "comic-storyline"), ("div", "class", "cc-newsbody"), ("div", "id", "newspost"))
+PROBE_IMG_IDS = ("cc-comic", "comic-image", "strip")
+PROBE_TARGETS = Targets(*(("img", "id", img_id) for img_id in PROBE_IMG_IDS), ("div", "id", "comic"), *IMG_ID_EXTRAS)
+
+
+def img_id_targets(img_id: str) -> Targets:
+    return Targets(("img", "id", img_id), *IMG_ID_EXTRAS)
+
+
+def parse_html(html: str, targets: Targets | None = None) -> BeautifulSoup:
+    if targets is not None and USE_TARGETS:
+        return BeautifulSoup(html, HTML_FEATURES, parse_only=targets)
+    return BeautifulSoup(html, HTML_FEATURES if USE_TARGETS else "html.parser")
+
+
+def find_iframe(html: str) -> str:
+    body = parse_html(html, COMIC_ROCKET_TARGETS).find("div", id="serialpagebody")
+    iframe = body.find("iframe")
+    return iframe["src"]
+
+
+def extract_wordpress(html: str) -> dict | None:
+    post = parse_html(html, WORDPRESS_TARGETS).find("div", class_="entry-content")
+    image = post.find("img")
+    if not image:
+        return None
+    return {"src": image["src"], "alt": image.get("alt")}
+
+
+def extract_first_img(html: str) -> str:
+    return parse_html(html, FREEFALL_TARGETS).find("img")["src"]
+
+
+def extract_img_id(html: str, img_id: str, page_url: str) -> dict | None:
+    return _img_id(parse_html(html, img_id_targets(img_id)), img_id, page_url)
+
+
+def _img_id(soup: BeautifulSoup, img_id: str, page_url: str) -> dict | None:
+    img = soup.find("img", id=img_id)
+    if img is None:
+        return None
+    title = img.get("title")
+    storyline = soup.find("select", {"name": "comic-storyline"})
+    if storyline:
+        storyline = storyline.find("option", selected=True)
+        if storyline:
+            title = f"{title} - {storyline.text.strip()}"
+    newsbody = soup.find("div", class_="cc-newsbody")
+    if not newsbody:
+        newsbody = soup.find("div", id="newspost")
+    news = None
+    if newsbody:
+        for link in newsbody.find_all("a"):
+            if link["href"].startswith("/"):
+                link["href"] = urllib.parse.urljoin(page_url, link["href"])
+        news = markdownify(str(newsbody)) or None
+    return {"src": urllib.parse.urljoin(page_url, img["src"]), "title": title, "has_news": bool(newsbody), "news": news}
+
+
+def extract_div_img(html: str, div_id: str) -> dict | None:
+    return _div_img(parse_html(html, Targets(("div", "id", div_id))), div_id)
+
+
+def _div_img(soup: BeautifulSoup, div_id: str) -> dict | None:
+    div = soup.find("div", id=div_id)
+    if not div:
+        return None
+    img = div.find("img")
+    if not img:
+        return None
+    return {"src": img["src"], "title": img.get("title")}
+
+
+def probe(html: str, page_url: str) -> tuple[str, str, str, dict] | None:
+    """Work out which solver suits a page, and extract what that solver needs while the page is parsed."""
+    soup = parse_html(html, PROBE_TARGETS)
+    for img_id in PROBE_IMG_IDS:
+        if soup.find("img", id=img_id):
+            return "ImgIdSolver", "img_id", img_id, _img_id(soup, img_id, page_url)
+    if soup.find("div", id="comic"):
+        return "DivIdSolver", "div_id", "comic", _div_img(soup, "comic")
+    return None
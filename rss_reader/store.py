@@ -0,0 +1,194 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import Any
+
+import shortuuid
+
+from rss_reader.seen import SeenSet
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS feeds (
+    id TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS subscribers (
+    feed_id TEXT NOT NULL REFERENCES feeds(id) ON DELETE CASCADE,
+    user INTEGER NOT NULL,
+    PRIMARY KEY (feed_id, user)
+);
+CREATE TABLE IF NOT EXISTS seen (
+    id INTEGER PRIMARY KEY,
+    feed_id TEXT NOT NULL REFERENCES feeds(id) ON DELETE CASCADE,
+    guid TEXT NOT NULL,
+    UNIQUE (feed_id, guid)
+);
+CREATE TABLE IF NOT EXISTS solver_hosts (
+    host TEXT NOT NULL,
+    pattern TEXT NOT NULL,
+    solver TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    confidence INTEGER NOT NULL,
+    expires REAL NOT NULL,
+    PRIMARY KEY (host, pattern)
+);
+CREATE TABLE IF NOT EXISTS latest (
+    feed_id TEXT PRIMARY KEY REFERENCES feeds(id) ON DELETE CASCADE,
+    guid TEXT,
+    title TEXT,
+    published TEXT,
+    url TEXT
+);
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY,
+    user INTEGER NOT NULL,
+    content TEXT,
+    embeds TEXT NOT NULL
+);
+"""
+
+# Keys of a feed dict that have their own columns or tables; everything else goes in feeds.data.
+COLUMNS = {"shortuuid", "url", "user", "seen", "latest"}
+
+
+class FeedStore:
+    """SQLite storage for RSS subscriptions.
+
+    Feeds are kept in memory as dicts, as they always have been. Saving a feed only touches that feed's rows, and only the
+    seen GUIDs that changed since it was last saved. Methods block, so call them with `asyncio.to_thread` from the bot.
+    """
+
+    def __init__(self, path: str = "feeds.db") -> None:
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+
+    def load(self) -> list[dict]:
+        with self.lock:
+            feeds = {}
+            for feed_id, url, data in self.conn.execute("SELECT id, url, data FROM feeds ORDER BY rowid"):
+                feed = json.loads(data)
+                feed.update(shortuuid=feed_id, url=url, seen=[])
+                feeds[feed_id] = feed
+            for feed_id, user in self.conn.execute("SELECT feed_id, user FROM subscribers"):
+                feeds[feed_id]["user"] = user
+            for feed_id, guid in self.conn.execute("SELECT feed_id, guid FROM seen ORDER BY id"):
+                feeds[feed_id]["seen"].append(guid)
+            for feed_id, guid, title, published, url in self.conn.execute("SELECT feed_id, guid, title, published, url FROM latest"):
+                feeds[feed_id]["latest"] = {key: value for key, value in (("guid", guid), ("title", title), ("published", published), ("url", url)) if value is not None}
+        for feed in feeds.values():
+            feed["seen"] = SeenSet(feed["seen"])
+        return list(feeds.values())
+
+    def snapshot(self, feed: dict) -> dict[str, Any]:
+        """Capture what needs writing for `feed`. Call this on the event loop, then pass the result to `write`."""
+        feed.setdefault("shortuuid", shortuuid.uuid())
+        added, evicted = feed["seen"].drain_changes()
+        return {
+            "id": feed["shortuuid"],
+            "url": feed["url"],
+            "user": feed.get("user"),
+            "data": json.dumps({key: value for key, value in feed.items() if key not in COLUMNS}),
+            "latest": dict(feed["latest"]) if feed.get("latest") else None,
+            "added": added,
+            "evicted": evicted,
+        }
+
+    def write(self, row: dict[str, Any]) -> None:
+        feed_id = row["id"]
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO feeds (id, url, data) VALUES (?, ?, ?) ON CONFLICT(id) DO UPDATE SET url = excluded.url, data = excluded.data",
+                (feed_id, row["url"], row["data"]),
+            )
+            if row["user"] is not None:
+                self.conn.execute("INSERT OR IGNORE INTO subscribers (feed_id, user) VALUES (?, ?)", (feed_id, row["user"]))
+            latest = row["latest"]
+            if latest:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO latest (feed_id, guid, title, published, url) VALUES (?, ?, ?, ?, ?)",
+                    (feed_id, latest.get("guid"), latest.get("title"), latest.get("published"), latest.get("url")),
+                )
+            # REPLACE rather than IGNORE, so a GUID that was evicted and seen again moves to the end.
+            self.conn.executemany("INSERT OR REPLACE INTO seen (feed_id, guid) VALUES (?, ?)", ((feed_id, guid) for guid in row["added"]))
+            self.conn.executemany("DELETE FROM seen WHERE feed_id = ? AND guid = ?", ((feed_id, guid) for guid in row["evicted"]))
+
+    def save(self, feed: dict) -> None:
+        row = self.snapshot(feed)
+        try:
+            self.write(row)
+        except Exception:
+            self.restore(feed, row)
+            raise
+
+    def restore(self, feed: dict, row: dict[str, Any]) -> None:
+        """Undo `snapshot` after a failed `write`, so the next save writes the seen changes again."""
+        feed["seen"].restore_changes(row["added"], row["evicted"])
+
+    def delete(self, feed: dict) -> None:
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM feeds WHERE id = ?", (feed["shortuuid"],))
+
+    def load_solver_hosts(self) -> list[dict]:
+        with self.lock:
+            cursor = self.conn.execute("SELECT host, pattern, solver, key, value, confidence, expires FROM solver_hosts")
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor]
+
+    def write_solver_hosts(self, changes: tuple[list[dict], list[tuple[str, str]]]) -> None:
+        """Apply `HostClassifier.drain_changes()`."""
+        changed, removed = changes
+        if not changed and not removed:
+            return
+        with self.lock, self.conn:
+            self.conn.executemany("DELETE FROM solver_hosts WHERE host = ? AND pattern = ?", removed)
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO solver_hosts (host, pattern, solver, key, value, confidence, expires) "
+                "VALUES (:host, :pattern, :solver, :key, :value, :confidence, :expires)",
+                changed,
+            )
+
+    def add_outbox(self, message: dict) -> int:
+        """Persist a message waiting to be sent and return its id."""
+        with self.lock, self.conn:
+            cursor = self.conn.execute("INSERT INTO outbox (user, content, embeds) VALUES (?, ?, ?)", (message["user"], message["content"], json.dumps(message["embeds"])))
+            return cursor.lastrowid
+
+    def load_outbox(self) -> list[dict]:
+        with self.lock:
+            rows = self.conn.execute("SELECT id, user, content, embeds FROM outbox ORDER BY id").fetchall()
+        return [{"id": message_id, "user": user, "content": content, "embeds": json.loads(embeds)} for message_id, user, content, embeds in rows]
+
+    def delete_outbox(self, ids: list[int]) -> None:
+        with self.lock, self.conn:
+            self.conn.executemany("DELETE FROM outbox WHERE id = ?", ((message_id,) for message_id in ids))
+
+    def import_json(self, path: str) -> list[dict]:
+        """Load a feeds.json from before the SQLite store, write it all to the database and return the feeds."""
+        with open(path) as f:
+            feeds = json.load(f)
+        for feed in feeds:
+            feed["seen"] = SeenSet(feed.get("seen", []), dirty=True)
+            self.save(feed)
+        return feeds
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def open_store(path: str = "feeds.db", legacy: str = "feeds.json") -> tuple[FeedStore, list[dict]]:
+    """Open the store, importing `legacy` the first time if there is one. The JSON file is renamed afterwards so it isn't imported twice."""
+    store = FeedStore(path)
+    feeds = store.load()
+    if not feeds and os.path.exists(legacy):
+        feeds = store.import_json(legacy)
+        os.replace(legacy, legacy + ".imported")
+        print(f"RSS: imported {len(feeds)} feeds from {legacy}")
+    return store, feeds
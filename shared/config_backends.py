@@ -0,0 +1,270 @@
+import abc
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+import uuid
+from typing import Any, Callable
+
+import sentry_sdk
+
+from .exceptions import OperationalException
+
+Listener = Callable[[str, Any], None]
+
+
+class ConfigBackend(abc.ABC):
+    """Storage for configuration values.
+
+    `load()` must be cheap enough to call on every `configuration.get`, so backends keep a local copy and only go to storage when it may be stale.
+    """
+
+    def __init__(self) -> None:
+        self.cfg: dict[str, Any] = {}
+        self.listeners: list[Listener] = []
+        self.reads = 0
+        self.writes = 0
+        self.hits = 0
+
+    @abc.abstractmethod
+    def load(self) -> dict[str, Any]:
+        ...
+
+    @abc.abstractmethod
+    def set(self, key: str, value: Any) -> None:
+        ...
+
+    def subscribe(self, listener: Listener) -> None:
+        self.listeners.append(listener)
+
+    def notify(self, key: str, value: Any) -> None:
+        for listener in self.listeners:
+            listener(key, value)
+
+    def replace(self, cfg: dict[str, Any]) -> None:
+        """Swap in a freshly loaded snapshot, notifying listeners of anything that changed."""
+        old, self.cfg = self.cfg, cfg
+        for key, value in cfg.items():
+            if key not in old or old[key] != value:
+                self.notify(key, value)
+
+    def stats(self) -> dict[str, int]:
+        return {"reads": self.reads, "writes": self.writes, "hits": self.hits}
+
+
+class JsonFileBackend(ConfigBackend):
+    """In-memory copy of config.json.
+
+    The file is only re-read when its inode, mtime or size changes, and only rewritten when a value is actually set.
+    """
+
+    def __init__(self, path: str = "config.json") -> None:
+        super().__init__()
+        self.path = path
+        self.signature: tuple[int, int, int] | None = None
+        self.loaded = False
+
+    def _stat(self) -> tuple[int, int, int] | None:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def load(self) -> dict[str, Any]:
+        signature = self._stat()
+        if self.loaded and signature == self.signature:
+            self.hits += 1
+            return self.cfg
+        try:
+            with open(self.path) as f:
+                cfg = json.load(f)
+        except FileNotFoundError:
+            cfg = {}
+        self.reads += 1
+        self.signature = signature
+        if self.loaded:
+            self.replace(cfg)
+        else:
+            self.cfg = cfg
+        self.loaded = True
+        return self.cfg
+
+    def set(self, key: str, value: Any) -> None:
+        self.load()
+        self.cfg[key] = value
+        self.save()
+        self.notify(key, value)
+
+    def save(self) -> None:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(prefix=".config.", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "w") as fh:
+                fh.write(json.dumps(self.cfg, indent=4, sort_keys=True))
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self.writes += 1
+        self.signature = self._stat()
+
+
+class SqliteBackend(ConfigBackend):
+    """Configuration in a local SQLite database, shared by every bot process on the machine.
+
+    `PRAGMA data_version` changes whenever another connection commits, so the local copy is only refreshed when someone else wrote to it.
+    """
+
+    def __init__(self, path: str = "config.db") -> None:
+        super().__init__()
+        self.path = path
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS config (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.data_version: int | None = None
+
+    def load(self) -> dict[str, Any]:
+        version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self.data_version:
+            self.hits += 1
+            return self.cfg
+        cfg = {key: json.loads(value) for key, value in self.conn.execute("SELECT key, value FROM config")}
+        self.reads += 1
+        if self.data_version is None:
+            self.cfg = cfg
+        else:
+            self.replace(cfg)
+        self.data_version = version
+        return self.cfg
+
+    def set(self, key: str, value: Any) -> None:
+        self.load()
+        self.conn.execute(
+            "INSERT INTO config (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, json.dumps(value)),
+        )
+        self.writes += 1
+        self.cfg[key] = value
+        self.notify(key, value)
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+class RedisBackend(ConfigBackend):
+    """Configuration in a Redis hash, kept in sync between processes with pub/sub.
+
+    Reads never leave the process: the hash is loaded once by `start()`, and every write is published so other processes can update their copy.
+    If the subscription drops, it is re-established with backoff and the hash reloaded, so changes missed meanwhile still arrive.
+    """
+
+    def __init__(self, redis: Any, key: str = "modbot:config", max_backoff: float = 60.0) -> None:
+        super().__init__()
+        self.redis = redis
+        self.key = key
+        self.channel = f"{key}:changes"
+        self.origin = uuid.uuid4().hex
+        self.pending: set[asyncio.Task] = set()
+        self.listener: asyncio.Task | None = None
+        self.pubsub = None
+        self.max_backoff = max_backoff
+        self.reconnects = 0
+
+    async def start(self, seed: dict[str, Any] | None = None) -> None:
+        """Load the hash and start following changes. Keys in `seed` are only written if Redis doesn't have them yet."""
+        for key, value in (seed or {}).items():
+            await self.redis.hsetnx(self.key, key, json.dumps(value))
+        await self._subscribe()
+        self.cfg = await self._fetch()
+        self.listener = asyncio.create_task(self._listen())
+
+    async def _subscribe(self) -> None:
+        if self.pubsub is not None:
+            try:
+                await self.pubsub.aclose()
+            except Exception:
+                pass
+        self.pubsub = self.redis.pubsub()
+        await self.pubsub.subscribe(self.channel)
+
+    async def _fetch(self) -> dict[str, Any]:
+        raw = await self.redis.hgetall(self.key)
+        self.reads += 1
+        return {_decode(key): json.loads(value) for key, value in raw.items()}
+
+    def load(self) -> dict[str, Any]:
+        self.hits += 1
+        return self.cfg
+
+    def set(self, key: str, value: Any) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            raise OperationalException("Redis configuration can only be written from inside the event loop")
+        self.cfg[key] = value
+        task = loop.create_task(self._publish(key, value))
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+        self.notify(key, value)
+
+    async def _publish(self, key: str, value: Any) -> None:
+        try:
+            await self.redis.hset(self.key, key, json.dumps(value))
+            await self.redis.publish(self.channel, json.dumps({"origin": self.origin, "key": key, "value": value}))
+        except Exception as e:
+            # The local copy already has the value, but other processes won't until it's written again.
+            print(f"CONFIG: failed to write {key} to Redis: {e!r}")
+            sentry_sdk.capture_exception(e)
+            return
+        self.writes += 1
+
+    async def _listen(self) -> None:
+        delay = 1.0
+        while True:
+            try:
+                async for message in self.pubsub.listen():
+                    delay = 1.0
+                    if message["type"] != "message":
+                        continue
+                    change = json.loads(message["data"])
+                    if change["origin"] == self.origin:
+                        continue
+                    self.cfg[change["key"]] = change["value"]
+                    self.notify(change["key"], change["value"])
+                print("CONFIG: Redis subscription ended")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"CONFIG: lost Redis subscription: {e!r}")
+                sentry_sdk.capture_exception(e)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_backoff)
+            try:
+                await self._subscribe()
+                # Subscribed again before reloading, so nothing written in between is missed.
+                self.replace(await self._fetch())
+                self.reconnects += 1
+            except Exception as e:
+                print(f"CONFIG: failed to reconnect to Redis: {e!r}")
+                sentry_sdk.capture_exception(e)
+
+    async def close(self) -> None:
+        """Wait for writes still in flight, then stop following changes."""
+        if self.pending:
+            await asyncio.gather(*self.pending, return_exceptions=True)
+        if self.listener:
+            self.listener.cancel()
+            self.listener = None
+        if self.pubsub:
+            try:
+                await self.pubsub.unsubscribe(self.channel)
+                await self.pubsub.aclose()
+            except Exception as e:
+                print(f"CONFIG: error closing Redis subscription: {e!r}")
+            self.pubsub = None
+
+
+def _decode(value: bytes | str) -> str:
+    return value.decode() if isinstance(value, bytes) else value
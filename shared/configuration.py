@@ -1,49 +1,99 @@
 import inspect
-import json
 import os
 import random
 import string
 from typing import Any
 
+from .config_backends import ConfigBackend, JsonFileBackend, Listener, RedisBackend, SqliteBackend
 from .exceptions import InvalidArgumentException
 
 DEFAULTS = {
     "token": "",
-    "owners": [154363842451734528, 222352614832996354]
+    "owners": [154363842451734528, 222352614832996354],
+    "config_backend": "json",
+    "config_db": "config.db",
 }
 
+# Needed before any shared backend can be reached, so these are always read from config.json.
+LOCAL_KEYS = {"token", "config_backend", "config_db"}
+
+local = JsonFileBackend()
+backend: ConfigBackend = local
+
+
+def _backend_for(key: str) -> ConfigBackend:
+    return local if key in LOCAL_KEYS else backend
+
+
 def get(key: str) -> Any:
-    try:
-        cfg = json.load(open('config.json'))
-    except FileNotFoundError:
-        cfg = {}
+    store = _backend_for(key)
+    cfg = store.load()
     if key in cfg:
         return cfg[key]
     elif key in os.environ:
-        cfg[key] = os.environ[key]
+        value = os.environ[key]
     elif key in DEFAULTS:
         # Lock in the default value if we use it.
-        cfg[key] = DEFAULTS[key]
+        value = DEFAULTS[key]
 
-        if inspect.isfunction(cfg[key]): # If default value is a function, call it.
-            cfg[key] = cfg[key]()
+        if inspect.isfunction(value): # If default value is a function, call it.
+            value = value()
     else:
         raise InvalidArgumentException('No default or other configuration value available for {key}'.format(key=key))
 
-    print("CONFIG: {0}={1}".format(key, cfg[key]))
-    fh = open('config.json', 'w')
-    fh.write(json.dumps(cfg, indent=4))
-    return cfg[key]
+    print("CONFIG: {0}={1}".format(key, value))
+    store.set(key, value)
+    return value
 
 def write(key: str, value: str) -> str:
-    try:
-        cfg = json.load(open('config.json'))
-    except FileNotFoundError:
-        cfg = {}
+    store = _backend_for(key)
+    cfg = store.load()
+    if key in cfg and cfg[key] == value:
+        return value
+
+    print("CONFIG: {0}={1}".format(key, value))
+    store.set(key, value)
+    return value
+
+def on_change(listener: Listener) -> None:
+    """Call `listener(key, value)` whenever a value is changed, by this process or another one."""
+    local.subscribe(listener)
+    if backend is not local:
+        backend.subscribe(listener)
+
+def use_backend(new_backend: ConfigBackend) -> None:
+    """Switch to `new_backend`, carrying over listeners and any values it doesn't have yet."""
+    global backend
+    cfg = new_backend.load()
+    for key, value in local.load().items():
+        if key not in LOCAL_KEYS and key not in cfg:
+            new_backend.set(key, value)
+    for listener in backend.listeners:
+        if listener not in new_backend.listeners:
+            new_backend.subscribe(listener)
+    backend = new_backend
+
+def init_backend() -> None:
+    """Select the backend named by `config_backend`. Redis has to wait for a connection, see `attach_redis`."""
+    if get("config_backend") == "sqlite":
+        use_backend(SqliteBackend(get("config_db")))
+
+async def attach_redis(redis: Any) -> None:
+    if get("config_backend") != "redis" or isinstance(backend, RedisBackend):
+        return
+    shared = RedisBackend(redis)
+    await shared.start(seed={key: value for key, value in local.load().items() if key not in LOCAL_KEYS})
+    use_backend(shared)
 
-    cfg[key] = value
+async def close() -> None:
+    """Flush and close the shared backend. Call before the process exits, so writes still in flight aren't lost."""
+    global backend
+    if isinstance(backend, RedisBackend):
+        await backend.close()
+    elif isinstance(backend, SqliteBackend):
+        backend.close()
+    backend = local
 
-    print("CONFIG: {0}={1}".format(key, cfg[key]))
-    fh = open('config.json', 'w')
-    fh.write(json.dumps(cfg, indent=4, sort_keys=True))
-    return cfg[key]
+def stats() -> dict[str, int]:
+    """Read/write counters for the active configuration backend."""
+    return backend.stats()
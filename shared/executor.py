@@ -0,0 +1,117 @@
+import asyncio
+import functools
+import time
+from collections import Counter
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, TypeVar
+
+from . import configuration
+
+configuration.DEFAULTS.update(
+    {
+        # "thread", "process", or "inline" to parse on the event loop as before.
+        "parse_executor": "thread",
+        "parse_workers": 2,
+    }
+)
+
+T = TypeVar("T")
+
+_executor: Executor | None = None
+# Seconds spent in, and calls to, each parse function, measured where it runs.
+parse_time: Counter[str] = Counter()
+parse_calls: Counter[str] = Counter()
+
+
+def get_executor() -> Executor | None:
+    global _executor
+    if _executor is None:
+        mode = configuration.get("parse_executor")
+        if mode == "process":
+            _executor = ProcessPoolExecutor(max_workers=configuration.get("parse_workers"))
+        elif mode == "thread":
+            _executor = ThreadPoolExecutor(max_workers=configuration.get("parse_workers"), thread_name_prefix="parse")
+    return _executor
+
+
+async def run_parser(func: Callable[..., T], *args: Any) -> T:
+    """Run CPU-heavy parsing off the event loop.
+
+    With a process pool, `func` must be a module-level function and its arguments and result must pickle, so keep both to plain data.
+    """
+    executor = get_executor()
+    if executor is None:
+        result, elapsed = _timed(func, *args)
+    else:
+        result, elapsed = await asyncio.get_running_loop().run_in_executor(executor, functools.partial(_timed, func, *args))
+    parse_time[func.__name__] += elapsed
+    parse_calls[func.__name__] += 1
+    return result
+
+
+def _timed(func: Callable[..., T], *args: Any) -> tuple[T, float]:
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def parse_stats() -> dict[str, dict[str, float]]:
+    return {name: {"calls": parse_calls[name], "seconds": parse_time[name]} for name in parse_calls}
+
+
+def reset_parse_stats() -> None:
+    parse_time.clear()
+    parse_calls.clear()
+
+
+def shutdown() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+class LoopMonitor:
+    """Measures how late the event loop wakes up a task that sleeps for `interval` seconds.
+
+    Anything that blocks the loop (like parsing a large page on it) shows up as lag.
+    """
+
+    def __init__(self, interval: float = 0.05) -> None:
+        self.interval = interval
+        self.samples: list[float] = []
+        self.task: asyncio.Task | None = None
+        self.sleeping_since: float | None = None
+
+    def start(self) -> None:
+        self.samples = []
+        self.task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            self.sleeping_since = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, time.perf_counter() - self.sleeping_since - self.interval))
+
+    def stop(self) -> dict[str, float]:
+        if self.task is not None:
+            # Count the sleep in progress too, or a block right before stopping would go unnoticed.
+            if self.sleeping_since is not None:
+                overdue = time.perf_counter() - self.sleeping_since - self.interval
+                if overdue > 0:
+                    self.samples.append(overdue)
+            self.task.cancel()
+            self.task = None
+            self.sleeping_since = None
+        return self.stats()
+
+    def stats(self) -> dict[str, float]:
+        if not self.samples:
+            return {"samples": 0, "max_ms": 0.0, "mean_ms": 0.0, "p99_ms": 0.0}
+        ordered = sorted(self.samples)
+        return {
+            "samples": len(ordered),
+            "max_ms": ordered[-1] * 1000,
+            "mean_ms": sum(ordered) / len(ordered) * 1000,
+            "p99_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000,
+        }
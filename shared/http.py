@@ -0,0 +1,51 @@
+from types import SimpleNamespace
+from typing import Any
+
+import aiohttp
+
+
+class HttpClient:
+    """A single pooled aiohttp session for outbound HTTP.
+
+    The session is created on first use, since aiohttp wants a running event loop.
+    """
+
+    def __init__(self, limit: int = 100, limit_per_host: int = 8, timeout: float = 30, connect_timeout: float = 10) -> None:
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=connect_timeout)
+        self._session: aiohttp.ClientSession | None = None
+        self.requests = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            trace = aiohttp.TraceConfig()
+            trace.on_request_start.append(self._on_request_start)
+            trace.on_connection_create_end.append(self._on_connection_create_end)
+            trace.on_connection_reuseconn.append(self._on_connection_reuseconn)
+            connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout, trace_configs=[trace])
+        return self._session
+
+    def get(self, url: str, **kwargs: Any) -> Any:
+        return self.session.get(url, **kwargs)
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _on_request_start(self, session: aiohttp.ClientSession, ctx: SimpleNamespace, params: Any) -> None:
+        self.requests += 1
+
+    async def _on_connection_create_end(self, session: aiohttp.ClientSession, ctx: SimpleNamespace, params: Any) -> None:
+        self.connections_created += 1
+
+    async def _on_connection_reuseconn(self, session: aiohttp.ClientSession, ctx: SimpleNamespace, params: Any) -> None:
+        self.connections_reused += 1
+
+    def stats(self) -> dict[str, int]:
+        return {"requests": self.requests, "connections_created": self.connections_created, "connections_reused": self.connections_reused}
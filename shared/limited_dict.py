@@ -1,19 +1,118 @@
+import asyncio
+import time
 from collections import OrderedDict
-from typing import Any
+from typing import Any, Awaitable, Callable, Generic, Hashable, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+_MISSING = object()
 
 
 # https://stackoverflow.com/a/2437645
 class LimitedSizeDict(OrderedDict):
-  def __init__(self, *args: Any, **kwds: Any) -> None:
-    self.size_limit = kwds.pop("size_limit", None)
-    OrderedDict.__init__(self, *args, **kwds)
-    self._check_size_limit()
-
-  def __setitem__(self, key, value):
-    OrderedDict.__setitem__(self, key, value)
-    self._check_size_limit()
-
-  def _check_size_limit(self) -> None:
-    if self.size_limit is not None:
-      while len(self) > self.size_limit:
-        self.popitem(last=False)
+    def __init__(self, *args: Any, **kwds: Any) -> None:
+        self.size_limit = kwds.pop("size_limit", None)
+        OrderedDict.__init__(self, *args, **kwds)
+        self._check_size_limit()
+
+    def __setitem__(self, key, value):
+        OrderedDict.__setitem__(self, key, value)
+        self._check_size_limit()
+
+    def _check_size_limit(self) -> None:
+        if self.size_limit is not None:
+            while len(self) > self.size_limit:
+                self.popitem(last=False)
+
+
+class LRUCache(Generic[K, V]):
+    """Least-recently-used cache with optional expiry.
+
+    `get_or_load` runs an async loader on a miss; concurrent misses for the same key wait on the same load instead of starting their own.
+    Failed loads are not cached.
+    """
+
+    def __init__(self, size_limit: int | None = 1024, ttl: float | None = None, clock: Callable[[], float] = time.monotonic) -> None:
+        self.size_limit = size_limit
+        self.ttl = ttl
+        self.clock = clock
+        self.data: OrderedDict[K, tuple[V, float | None]] = OrderedDict()
+        self.inflight: dict[K, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.loads = 0
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __contains__(self, key: K) -> bool:
+        return self._lookup(key, count=False) is not _MISSING
+
+    def _lookup(self, key: K, count: bool = True) -> Any:
+        entry = self.data.get(key)
+        if entry is None:
+            if count:
+                self.misses += 1
+            return _MISSING
+        value, expires = entry
+        if expires is not None and expires <= self.clock():
+            del self.data[key]
+            self.expirations += 1
+            if count:
+                self.misses += 1
+            return _MISSING
+        if count:
+            self.hits += 1
+            self.data.move_to_end(key)
+        return value
+
+    def get(self, key: K, default: V | None = None) -> V | None:
+        value = self._lookup(key)
+        return default if value is _MISSING else value
+
+    def set(self, key: K, value: V, ttl: float | None = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        self.data[key] = (value, None if ttl is None else self.clock() + ttl)
+        self.data.move_to_end(key)
+        if self.size_limit is not None:
+            while len(self.data) > self.size_limit:
+                self.data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: K) -> None:
+        self.data.pop(key, None)
+
+    def clear(self) -> None:
+        self.data.clear()
+
+    async def get_or_load(self, key: K, loader: Callable[[], Awaitable[V]], ttl: float | None = None) -> V:
+        value = self._lookup(key)
+        if value is not _MISSING:
+            return value
+        task = self.inflight.get(key)
+        if task is None:
+            self.loads += 1
+            task = asyncio.ensure_future(loader())
+            self.inflight[key] = task
+            task.add_done_callback(lambda t: self._loaded(key, t, ttl))
+        # Shielded so one caller being cancelled doesn't cancel the load for everyone else waiting on it.
+        return await asyncio.shield(task)
+
+    def _loaded(self, key: K, task: asyncio.Future, ttl: float | None) -> None:
+        if self.inflight.get(key) is task:
+            del self.inflight[key]
+        if not task.cancelled() and task.exception() is None:
+            self.set(key, task.result(), ttl)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "size": len(self.data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "loads": self.loads,
+        }
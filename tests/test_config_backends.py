@@ -0,0 +1,177 @@
+import asyncio
+
+import fakeredis
+import pytest
+
+from shared import configuration
+from shared.config_backends import ConfigBackend, JsonFileBackend, RedisBackend, SqliteBackend
+
+
+async def wait_for(condition, timeout: float = 2.0) -> None:
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition():
+        if loop.time() > deadline:
+            raise AssertionError("condition not met in time")
+        await asyncio.sleep(0.01)
+
+
+_sleep = asyncio.sleep
+
+
+async def _fast_sleep(delay, *args):
+    await _sleep(min(delay, 0.01), *args)
+
+
+@pytest.fixture
+def local(tmp_path, monkeypatch):
+    backend = JsonFileBackend(str(tmp_path / "config.json"))
+    monkeypatch.setattr(configuration, "local", backend)
+    monkeypatch.setattr(configuration, "backend", backend)
+    return backend
+
+
+def test_json_round_trip(tmp_path):
+    path = str(tmp_path / "config.json")
+    backend = JsonFileBackend(path)
+    backend.set("rss_batch_window", 5)
+    backend.set("owners", [1, 2])
+    assert JsonFileBackend(path).load() == {"rss_batch_window": 5, "owners": [1, 2]}
+
+
+def test_json_reloads_only_when_changed(tmp_path):
+    path = str(tmp_path / "config.json")
+    backend = JsonFileBackend(path)
+    backend.set("a", 1)
+    backend.load()
+    reads = backend.reads
+    backend.load()
+    assert backend.reads == reads
+
+    changes = []
+    backend.subscribe(lambda key, value: changes.append((key, value)))
+    JsonFileBackend(path).set("a", 2)
+    assert backend.load()["a"] == 2
+    assert changes == [("a", 2)]
+
+
+def test_sqlite_round_trip_and_change_notification(tmp_path):
+    path = str(tmp_path / "config.db")
+    first, second = SqliteBackend(path), SqliteBackend(path)
+    changes = []
+    second.subscribe(lambda key, value: changes.append((key, value)))
+    second.load()
+
+    first.set("rss_batch_window", 5)
+    first.set("owners", [1, 2])
+    assert second.load() == {"rss_batch_window": 5, "owners": [1, 2]}
+    assert changes == [("rss_batch_window", 5), ("owners", [1, 2])]
+    first.close()
+    second.close()
+
+
+def test_redis_round_trip_and_change_notification():
+    async def run():
+        server = fakeredis.FakeServer()
+        first = RedisBackend(fakeredis.FakeAsyncRedis(server=server))
+        second = RedisBackend(fakeredis.FakeAsyncRedis(server=server))
+        await first.start(seed={"owners": [1]})
+        await second.start(seed={"owners": [2]})
+        # The first process to start seeds the hash; later seeds don't overwrite it.
+        assert second.load() == {"owners": [1]}
+
+        changes = []
+        second.subscribe(lambda key, value: changes.append((key, value)))
+        first.set("rss_batch_window", 5)
+        await wait_for(lambda: changes)
+        assert changes == [("rss_batch_window", 5)]
+        assert second.load()["rss_batch_window"] == 5
+
+        await first.close()
+        third = RedisBackend(fakeredis.FakeAsyncRedis(server=server))
+        await third.start(seed={})
+        assert third.load() == {"owners": [1], "rss_batch_window": 5}
+        await second.close()
+        await third.close()
+
+    asyncio.run(run())
+
+
+def test_redis_publish_failure_is_reported(monkeypatch):
+    async def run():
+        backend = RedisBackend(fakeredis.FakeAsyncRedis())
+        await backend.start(seed={})
+        captured = []
+        monkeypatch.setattr("sentry_sdk.capture_exception", captured.append)
+
+        async def broken(*args):
+            raise ConnectionError("gone")
+
+        monkeypatch.setattr(backend.redis, "hset", broken)
+        backend.set("a", 1)
+        await backend.close()
+        assert backend.load() == {"a": 1}
+        assert backend.writes == 0
+        assert len(captured) == 1
+
+    asyncio.run(run())
+
+
+def test_redis_listener_reconnects_and_catches_up(monkeypatch):
+    async def run():
+        server = fakeredis.FakeServer()
+        backend = RedisBackend(fakeredis.FakeAsyncRedis(server=server), max_backoff=0.05)
+        await backend.start(seed={})
+        monkeypatch.setattr("sentry_sdk.capture_exception", lambda e: None)
+        monkeypatch.setattr(asyncio, "sleep", _fast_sleep)
+        changes = []
+        backend.subscribe(lambda key, value: changes.append((key, value)))
+
+        async def dropped():
+            raise ConnectionError("connection lost")
+            yield
+
+        backend.pubsub.listen = dropped
+        # Written while the subscription is down, so it only arrives through the reload.
+        other = RedisBackend(fakeredis.FakeAsyncRedis(server=server))
+        await other.start(seed={"a": 1})
+        await wait_for(lambda: backend.reconnects)
+        assert changes == [("a", 1)]
+
+        other.set("b", 2)
+        await wait_for(lambda: ("b", 2) in changes)
+        await backend.close()
+        await other.close()
+
+    asyncio.run(run())
+
+
+def test_use_backend_seeds_missing_keys_and_keeps_listeners(local, tmp_path):
+    local.set("token", "secret")
+    local.set("owners", [1])
+    local.set("rss_batch_window", 5)
+    changes = []
+    configuration.on_change(lambda key, value: changes.append((key, value)))
+
+    shared = SqliteBackend(str(tmp_path / "config.db"))
+    shared.set("rss_batch_window", 10)
+    configuration.use_backend(shared)
+
+    # Local-only keys stay out, and values the shared store already has win.
+    assert shared.load() == {"owners": [1], "rss_batch_window": 10}
+    assert configuration.get("rss_batch_window") == 10
+    assert configuration.get("token") == "secret"
+
+    configuration.write("owners", [2])
+    assert ("owners", [2]) in changes
+    asyncio.run(configuration.close())
+    assert configuration.backend is local
+
+
+def test_backend_must_implement_load_and_set():
+    class Incomplete(ConfigBackend):
+        def load(self):
+            return {}
+
+    with pytest.raises(TypeError):
+        Incomplete()
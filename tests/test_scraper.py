@@ -0,0 +1,71 @@
+"""Checks `scraper.parse` against a saved listings page.
+
+pf_bot/fixtures/listings.expected has one JSON line per listing in pf_bot/fixtures/listings.html: its repr, roles bitmask
+and slot jobs. After an intentional change to the parsed output, regenerate it with `PYTHONPATH=. python tests/test_scraper.py`.
+"""
+import json
+import os
+
+import pytest
+
+from pf_bot import scraper
+from pf_bot.watches import role_mask
+
+FIXTURES = os.path.join(os.path.dirname(__file__), os.pardir, "pf_bot", "fixtures")
+PAGE = os.path.join(FIXTURES, "listings.html")
+EXPECTED = os.path.join(FIXTURES, "listings.expected")
+
+NO_DESCRIPTION = """
+<div class="listing" data-id="1" data-centre="Light" data-pf-category="Raids">
+  <div class="left"><div class="duty">Eden's Promise: Eternity (Savage)</div></div>
+  <div class="right meta">
+    <div class="party"><div class="slot filled tank" title="GNB"></div><div class="slot healer" title="WHM SCH AST SGE"></div></div>
+    <div class="item expires"><span class="text">in 5 minutes</span></div>
+    <div class="item updated"><span class="text">now</span></div>
+  </div>
+</div>
+"""
+
+
+def summarize(listing: scraper.Listing) -> list:
+    return [repr(listing), listing.roles, [slot.job for slot in listing.slots]]
+
+
+@pytest.fixture(scope="module")
+def listings() -> list[scraper.Listing]:
+    with open(PAGE) as f:
+        return scraper.parse(f.read())
+
+
+def test_parse_matches_expected(listings):
+    with open(EXPECTED) as f:
+        expected = [json.loads(line) for line in f]
+    assert len(listings) == len(expected)
+    for listing, want in zip(listings, expected):
+        assert summarize(listing) == want, listing.id
+
+
+def test_roles_bitmask_matches_slots(listings):
+    for listing in listings:
+        for role in ("tank", "healer", "dps"):
+            by_slots = any(slot.role in [role, "empty"] for slot in listing.slots)
+            assert bool(listing.roles & role_mask(role)) == by_slots, (listing.id, role)
+
+
+def test_parse_without_description():
+    (listing,) = scraper.parse(NO_DESCRIPTION)
+    assert listing.description is None
+    assert listing.duty == "Eden's Promise: Eternity (Savage)"
+    assert not (listing.loot or listing.duty_complete or listing.duty_completion or listing.practice)
+    assert [slot.job for slot in listing.slots] == ["GNB", "WHM SCH AST SGE"]
+    assert listing.roles & role_mask("healer")
+    assert not listing.roles & scraper.ROLE_BITS["dps"]
+
+
+if __name__ == "__main__":
+    with open(PAGE) as f:
+        parsed = scraper.parse(f.read())
+    with open(EXPECTED, "w") as f:
+        for listing in parsed:
+            f.write(json.dumps(summarize(listing)) + "\n")
+    print(f"wrote {len(parsed)} listings to {EXPECTED}")